@@ -5,10 +5,11 @@ import os
 import re
 from dotenv import load_dotenv
 import time
-from src.Agents.agents import qa_agent 
+from src.Agents.agents import qa_agent, llm_cache, llm_ledger
+from src.Utilities.llm_ledger import llm_stage
 
 from browser_use import Browser, Agent as BrowserAgent
-from src.Utilities.utils import controller 
+from src.Utilities.utils import controller, LedgerCallbackHandler
 from langchain_openai import ChatOpenAI
 
 from src.Prompts.agno_prompts import (
@@ -17,7 +18,13 @@ from src.Prompts.agno_prompts import (
     generate_cypress_js,
     generate_robot_framework,
     generate_java_selenium,
-    generate_gherkin_scenarios
+    generate_gherkin_scenarios,
+    generate_all_frameworks,
+    bundle_generated_code,
+    template_generator,
+    POLISH_NEVER,
+    POLISH_UNSUPPORTED,
+    POLISH_ALWAYS
 )
 
 from src.Prompts.browser_prompts import (
@@ -25,11 +32,10 @@ from src.Prompts.browser_prompts import (
 )
 
 # Import website discovery utilities
-from src.Utilities.website_discovery import (
-    discover_website_structure,
-    identify_features,
-    generate_scenarios_from_features
-)
+from src.Utilities.website_discovery import run_discovery_pipeline
+from src.Utilities.page_records import CompactPages
+from src.Utilities.test_ir import build_test_ir, split_scenarios
+from src.Utilities.code_templates import TEMPLATE_EMITTERS
 
 # Load environment variables
 load_dotenv()
@@ -57,6 +63,41 @@ FRAMEWORK_EXTENSIONS = {
     "Selenium + Cucumber (Java)": "java"
 }
 
+# Dictionary mapping framework names to their syntax highlighting languages
+FRAMEWORK_LANGUAGES = {
+    "Selenium + PyTest BDD (Python)": "python",
+    "Playwright (Python)": "python",
+    "Cypress (JavaScript)": "javascript",
+    "Robot Framework": "robot",
+    "Selenium + Cucumber (Java)": "java"
+}
+
+# Code generation modes -> how template-capable frameworks use the LLM (None = LLM only)
+CODEGEN_MODES = {
+    "Templates, LLM only for unsupported steps": POLISH_UNSUPPORTED,
+    "Templates only (no LLM)": POLISH_NEVER,
+    "Templates + LLM polish": POLISH_ALWAYS,
+    "LLM only": None
+}
+
+def code_generators(codegen_mode):
+    """FRAMEWORK_GENERATORS with template generators swapped in where the mode and framework allow"""
+    polish = CODEGEN_MODES[codegen_mode]
+    if polish is None:
+        return FRAMEWORK_GENERATORS
+    return {
+        framework: template_generator(framework, polish) if framework in TEMPLATE_EMITTERS else generator
+        for framework, generator in FRAMEWORK_GENERATORS.items()
+    }
+
+def shared_test_ir():
+    """TestIR of the current steps and execution, built once and reused by every framework"""
+    test_ir = st.session_state.get("test_ir")
+    if test_ir is None or test_ir.gherkin != st.session_state.edited_steps:
+        test_ir = build_test_ir(st.session_state.edited_steps, st.session_state.history)
+        st.session_state.test_ir = test_ir
+    return test_ir
+
 # Framework descriptions
 framework_descriptions = {
     "Selenium + PyTest BDD (Python)": "Popular Python testing framework combining Selenium WebDriver with PyTest BDD for behavior-driven development. Best for Python developers who want strong test organization and reporting.",
@@ -315,6 +356,30 @@ def main():
             list(FRAMEWORK_GENERATORS.keys()),
             index=0
         )
+        codegen_mode = st.selectbox(
+            "Code generation:",
+            list(CODEGEN_MODES),
+            index=0,
+            help=f"Templates write {', '.join(TEMPLATE_EMITTERS)} code from the recorded actions in milliseconds; "
+                 "other frameworks always use the LLM"
+        )
+        generate_all = st.checkbox(
+            "Generate code for all frameworks",
+            value=False,
+            help="Generate every framework at once, in parallel, and download them as one zip"
+        )
+        stream_output = st.checkbox(
+            "Stream generated text",
+            value=True,
+            help="Show Gherkin and code as they are generated instead of waiting for the full response"
+        )
+        
+        if llm_cache is not None:
+            cache_stats = llm_cache.stats()
+            st.caption(f"LLM cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+                       f"{cache_stats['entries']} responses stored")
+            if st.button("Clear LLM cache"):
+                llm_cache.clear()
         
         # Framework information section with tabs
         with st.expander("Framework Information"):
@@ -408,6 +473,98 @@ def main():
             value=1,
             help="How many levels of links to follow from the homepage"
         )
+        
+        # Add a slider for crawl parallelism
+        max_concurrency = st.slider(
+            "Parallel Pages (more = faster crawl, more memory)",
+            min_value=1,
+            max_value=8,
+            value=4,
+            help="How many pages are loaded at the same time during discovery"
+        )
+        
+        llm_concurrency = st.slider(
+            "Parallel LLM Calls",
+            min_value=1,
+            max_value=16,
+            value=4,
+            help="How many pages are analyzed by the model at the same time"
+        )
+        
+        batch_token_budget = st.number_input(
+            "Batch small pages up to (prompt tokens, 0 = one page per request)",
+            min_value=0,
+            max_value=8000,
+            value=2000,
+            step=500,
+            help="Small pages are analyzed together in one LLM request until their combined content reaches this size"
+        )
+        
+        crawl_processes = st.slider(
+            "Crawler Processes (for very large sites)",
+            min_value=1,
+            max_value=8,
+            value=1,
+            help="Split the crawl across several processes, each with its own browser loading the number of parallel pages above"
+        )
+        
+        load_profile = st.selectbox(
+            "Page Load Mode",
+            ["fast", "minimal", "full"],
+            index=0,
+            help="fast: skip images/fonts/trackers and wait for the DOM to settle; minimal: also skip stylesheets and third-party requests; full: load everything and wait for network idle"
+        )
+        
+        fetch_mode = st.selectbox(
+            "Page Fetch Mode",
+            ["hybrid", "browser"],
+            index=0,
+            help="hybrid: fetch server-rendered pages over plain HTTP and only open JS-rendered pages in the browser; browser: open every page in the browser"
+        )
+        
+        use_sitemap = st.checkbox(
+            "Seed crawl from sitemap.xml and robots.txt",
+            value=False,
+            help="Crawl every page listed in the site's sitemaps in one parallel sweep (newest first) and respect robots.txt"
+        )
+        
+        analyze_per_template = st.checkbox(
+            "Analyze one page per template",
+            value=True,
+            help="Pages sharing a layout (e.g. /product/1 ... /product/500) are analyzed once through a representative page"
+        )
+        
+        with st.expander("Crawl Budgets & Politeness"):
+            max_pages = st.number_input(
+                "Max pages (0 = unlimited)",
+                min_value=0,
+                value=50,
+                help="Stop crawling after this many pages and work with what was found"
+            )
+            max_minutes = st.number_input(
+                "Max crawl time in minutes (0 = unlimited)",
+                min_value=0.0,
+                value=10.0,
+                step=1.0
+            )
+            max_elements = st.number_input(
+                "Max interactive elements per site (0 = unlimited)",
+                min_value=0,
+                value=0
+            )
+            requests_per_second = st.number_input(
+                "Max requests per second per host (0 = unlimited)",
+                min_value=0.0,
+                value=5.0,
+                step=0.5,
+                help="Throttle requests to fragile staging servers"
+            )
+        
+        use_crawl_cache = st.checkbox(
+            "Reuse unchanged pages from previous discoveries",
+            value=True,
+            help="Only pages whose content changed since the last run are re-extracted"
+        )
     
     st.markdown('</div>', unsafe_allow_html=True)
 
@@ -426,8 +583,13 @@ def main():
     if generate_btn and user_story:
         with st.spinner("Generating Gherkin scenarios from user story..."):
             prompt = generate_gherkin_scenarios(user_story)
-            run_response = qa_agent.run(prompt)
-            generated_steps = run_response.content
+            stream_box = st.empty()
+            show_partial_steps = (lambda text: stream_box.code(text, language="gherkin")) if stream_output else None
+            with llm_ledger.run("story") as run_id, llm_stage("story_to_gherkin"):
+                generated_steps = qa_agent.complete(prompt, show_partial_steps)
+            st.session_state.llm_run_id = run_id
+            # The editor below shows the finished scenarios
+            stream_box.empty()
             
             # Initialize both generated_steps and edited_steps in session state
             st.session_state.generated_steps = generated_steps
@@ -443,60 +605,75 @@ def main():
             progress_text = st.empty()
             status_box = st.empty()
             
-            # Step 1: Website Discovery
-            progress_text.text("Step 1/3: Crawling website structure...")
-            status_box.info("This may take a few minutes depending on website size and depth setting")
+            progress_text.text("Crawling, analyzing and generating scenarios...")
+            status_box.info("Pages are analyzed while the crawl is still running; this may take a few minutes depending on website size and depth setting")
             
             start_time = time.time()
             
-            try:
-                # Use asyncio to run the discovery process
-                discovered_pages, navigation_map = asyncio.run(
-                    discover_website_structure(start_url, max_depth=max_depth)
+            def show_pipeline_progress(pipeline_progress):
+                # All three stages advance at once, so blend them into one bar
+                crawl_total = pipeline_progress["pages_crawled"] + pipeline_progress["pages_pending"]
+                if pipeline_progress["crawl_done"]:
+                    crawl_fraction = 1.0
+                else:
+                    crawl_fraction = pipeline_progress["pages_crawled"] / max(crawl_total, 1)
+                to_analyze = max(pipeline_progress["pages_to_analyze"], 1)
+                feature_fraction = pipeline_progress["pages_analyzed"] / to_analyze
+                scenario_fraction = pipeline_progress["pages_completed"] / to_analyze
+                progress.progress(min(int(100 * (crawl_fraction + feature_fraction + scenario_fraction) / 3), 100))
+                progress_text.text(
+                    f"Crawled {pipeline_progress['pages_crawled']}/{crawl_total} pages | "
+                    f"Features {pipeline_progress['pages_analyzed']}/{pipeline_progress['pages_to_analyze']} | "
+                    f"Scenarios {pipeline_progress['pages_completed']}/{pipeline_progress['pages_to_analyze']}"
                 )
-                progress.progress(33)
+            
+            try:
+                # Crawl, feature identification and scenario generation run as one streaming pipeline
+                with llm_ledger.run("discovery") as run_id:
+                    pipeline_result = asyncio.run(
+                        run_discovery_pipeline(
+                            start_url,
+                            qa_agent,
+                            analyze_per_template=analyze_per_template,
+                            on_progress=show_pipeline_progress,
+                            llm_concurrency=llm_concurrency,
+                            batch_token_budget=batch_token_budget,
+                            max_depth=max_depth,
+                            max_concurrency=max_concurrency,
+                            use_cache=use_crawl_cache,
+                            load_profile=load_profile,
+                            use_sitemap=use_sitemap,
+                            max_pages=max_pages or None,
+                            max_seconds=max_minutes * 60 or None,
+                            max_elements=max_elements or None,
+                            requests_per_second=requests_per_second or None,
+                            shards=crawl_processes,
+                            fetch_mode=fetch_mode
+                        )
+                    )
+                st.session_state.llm_run_id = run_id
+                # Kept in session_state for the whole session, so store it compactly
+                discovered_pages = CompactPages(pipeline_result["discovered_pages"])
+                navigation_map = pipeline_result["navigation_map"]
+                page_clusters = pipeline_result["page_clusters"]
+                all_features = pipeline_result["all_features"]
+                generated_steps = pipeline_result["generated_steps"]
+                
                 page_count = len(discovered_pages)
                 if page_count == 0:
                     st.error(f"Could not discover any pages at {start_url}. Please check the URL and try again.")
                     st.stop()
-                
-                status_box.success(f"Found {page_count} pages in {time.time() - start_time:.1f} seconds")
-                
-                # Step 2: Feature Identification
-                progress_text.text("Step 2/3: Identifying website features...")
-                status_box.info("AI is analyzing page structure to identify features")
-                feature_start_time = time.time()
-                
-                # Process pages one at a time for better feature identification
-                all_features = []
-                
-                for i, url in enumerate(discovered_pages.keys()):
-                    chunk_pages = {url: discovered_pages[url]}
-                    chunk_nav = {target: info for target, info in navigation_map.items() if info["from"] == url or target == url}
-                    
-                    chunk_features = identify_features(chunk_pages, chunk_nav, qa_agent)
-                    all_features.extend(chunk_features)
-                    
-                    # Update progress
-                    chunk_progress = 33 + (33 * (i + 1) / len(discovered_pages))
-                    progress.progress(int(chunk_progress))
-                    feature_count = len(chunk_features)
-                    status_box.info(f"Analyzed {feature_count} features for page {i+1}/{len(discovered_pages)}: {url}")
-                
-                status_box.success(f"Identified {len(all_features)} total features in {time.time() - feature_start_time:.1f} seconds")
-                
-                # Step 3: Scenario Generation
-                progress_text.text("Step 3/3: Generating comprehensive test scenarios...")
-                status_box.info("Creating detailed Gherkin scenarios based on features (this may take some time)")
-                scenario_start_time = time.time()
-                
-                generated_steps = generate_scenarios_from_features(all_features, navigation_map, qa_agent)
                 progress.progress(100)
                 
+                budget_exhausted = pipeline_result["crawl_stats"].get("budget_exhausted")
+                if budget_exhausted:
+                    st.warning(f"Crawl budget exhausted ({budget_exhausted}): results cover the {page_count} pages crawled before the limit was reached.")
+                
                 # Store results in session state
                 st.session_state.discovered_pages = discovered_pages
                 st.session_state.navigation_map = navigation_map
                 st.session_state.all_features = all_features
+                st.session_state.page_clusters = page_clusters
                 st.session_state.generated_steps = generated_steps
                 st.session_state.edited_steps = generated_steps
                 
@@ -506,19 +683,36 @@ def main():
                 # Count scenarios
                 scenario_count = len(generated_steps.split("Scenario:")) - 1
                 
-                status_box.success(f"Generated {scenario_count} scenarios in {time.time() - scenario_start_time:.1f} seconds")
+                status_box.success(f"Found {page_count} pages ({len(page_clusters)} templates), identified {len(all_features)} features and generated {scenario_count} scenarios")
                 st.markdown(f'<div class="status-success fade-in">Website analyzed and {scenario_count} scenarios generated successfully in {elapsed_time:.1f} seconds!</div>', unsafe_allow_html=True)
                 
                 # Display stats
                 st.markdown("### Discovery Statistics")
-                col1, col2, col3 = st.columns(3)
+                col1, col2, col3, col4 = st.columns(4)
                 with col1:
                     st.metric("Pages Found", len(discovered_pages))
                 with col2:
-                    st.metric("Features Identified", len(all_features))
+                    st.metric("Page Templates", len(page_clusters))
                 with col3:
+                    st.metric("Features Identified", len(all_features))
+                with col4:
                     st.metric("Scenarios Generated", scenario_count)
                 
+                # Show how pages were grouped into templates
+                with st.expander("View Page Templates"):
+                    import pandas as pd
+                    template_df_data = []
+                    for template, cluster in page_clusters.items():
+                        template_df_data.append({
+                            "Template": template,
+                            "Representative": cluster["representative"],
+                            "Pages": len(cluster["urls"]),
+                            "Examples": ", ".join(cluster["urls"][:3])
+                        })
+                    
+                    if template_df_data:
+                        st.dataframe(pd.DataFrame(template_df_data))
+                
                 # Show sample of discovered content
                 with st.expander("View Website Structure Details"):
                     # Show a summary of discovered pages
@@ -529,7 +723,11 @@ def main():
                             "URL": url,
                             "Title": data.get("title", "Unknown"),
                             "Elements": len(data.get("elements", [])),
-                            "Forms": len(data.get("forms", []))
+                            "Forms": len(data.get("forms", [])),
+                            "Cached": data.get("from_cache", False),
+                            "Fetched Via": data.get("fetch_mode", ""),
+                            "Load (ms)": data.get("load_time_ms"),
+                            "Template": data.get("template", "")
                         })
                     
                     import pandas as pd
@@ -647,18 +845,9 @@ def main():
                     browser = Browser()
                     
                     async with await browser.new_context() as context:
-                        # Parse the Gherkin content to extract scenarios
-                        scenarios = []
-                        current_scenario = []
-                        for line in steps.split('\n'):
-                            if line.strip().startswith('Scenario:'):
-                                if current_scenario:
-                                    scenarios.append('\n'.join(current_scenario))
-                                current_scenario = [line]
-                            elif current_scenario:
-                                current_scenario.append(line)
-                        if current_scenario:
-                            scenarios.append('\n'.join(current_scenario))
+                        # Parse the Gherkin content to extract scenarios; code generation
+                        # splits with the same function to match recorded actions to them
+                        scenarios = split_scenarios(steps)
                         
                         # Execute each scenario separately
                         all_results = []
@@ -672,7 +861,8 @@ def main():
                                 llm=ChatOpenAI(
                                     model='gpt-4o',  # Using gpt-4 for better accuracy/speed balance
                                     temperature=0.2,  # Lower temperature for more consistent responses
-                                    api_key=os.environ.get("OPENAI_API_KEY")
+                                    api_key=os.environ.get("OPENAI_API_KEY"),
+                                    callbacks=[LedgerCallbackHandler(llm_ledger, "browser_agent_step", "gpt-4o")]
                                 ),
                                 browser=browser,
                                 controller=controller,
@@ -698,6 +888,8 @@ def main():
                                 action_detail = {
                                     "name": action_name,
                                     "index": i,
+                                    "scenario": len(all_results) - 1,
+                                    "params": action_data.get(action_name) if isinstance(action_data.get(action_name), dict) else {},
                                     "element_details": {}
                                 }
                                 
@@ -768,6 +960,8 @@ def main():
                             "model_actions": history.model_actions(),
                             "execution_date": st.session_state.get("execution_date", "Unknown")
                         }
+                        # Code generation rebuilds its shared TestIR from the new history
+                        st.session_state.pop("test_ir", None)
                         
                         # Display test execution details
                         st.markdown('<div class="status-success fade-in">Test execution completed!</div>', unsafe_allow_html=True)
@@ -821,22 +1015,64 @@ def main():
                     st.markdown(f'<div class="status-error">An error occurred during test execution: {str(e)}</div>', unsafe_allow_html=True)
                     
             st.session_state.execution_date = "February 26, 2025"
-            asyncio.run(execute_test(steps_to_execute))  # Use steps_to_execute instead of generated_steps
+            with llm_ledger.run("execution") as run_id:
+                asyncio.run(execute_test(steps_to_execute))  # Use steps_to_execute instead of generated_steps
+            st.session_state.llm_run_id = run_id
     # Code Generation Section
     if generate_code_btn:
         if "edited_steps" not in st.session_state or "history" not in st.session_state:
             st.markdown('<div class="status-error">Please generate and execute Gherkin scenarios first.</div>', unsafe_allow_html=True)
+        elif generate_all:
+            with st.spinner("Generating automation code for all frameworks..."):
+                test_ir = shared_test_ir()
+                with llm_ledger.run("codegen_all") as run_id:
+                    results = asyncio.run(generate_all_frameworks(code_generators(codegen_mode), test_ir, llm_concurrency))
+                st.session_state.llm_run_id = run_id
+                
+                generated_code = {framework: result for framework, result in results.items() if isinstance(result, str)}
+                for framework, result in results.items():
+                    if isinstance(result, Exception):
+                        st.markdown(f'<div class="status-error">Error generating {framework} code: {str(result)}</div>', unsafe_allow_html=True)
+                
+                if generated_code:
+                    st.markdown('<div class="card code-container fade-in">', unsafe_allow_html=True)
+                    st.markdown('<h3 class="glow-text">Generated Automation Code</h3>', unsafe_allow_html=True)
+                    for tab, (framework, code) in zip(st.tabs(list(generated_code)), generated_code.items()):
+                        with tab:
+                            st.code(code, language=FRAMEWORK_LANGUAGES[framework])
+                    st.markdown('</div>', unsafe_allow_html=True)
+                    
+                    col1, col2, col3 = st.columns([1, 2, 1])
+                    with col2:
+                        st.download_button(
+                            label=f"📥 Download {len(generated_code)} Frameworks (zip)",
+                            data=bundle_generated_code(test_ir, generated_code, FRAMEWORK_EXTENSIONS),
+                            file_name=f"{test_ir.feature_name.lower()}_automation.zip",
+                            mime="application/zip",
+                        )
+                    
+                    st.markdown('<div class="status-success fade-in">Automation code generated successfully!</div>', unsafe_allow_html=True)
         else:
             with st.spinner(f"Generating {selected_framework} automation code..."):
                 try:
                     # Get the appropriate generator function
-                    generator_function = FRAMEWORK_GENERATORS[selected_framework]
+                    generator_function = code_generators(codegen_mode)[selected_framework]
+                    
+                    # Use appropriate language for syntax highlighting
+                    code_language = FRAMEWORK_LANGUAGES[selected_framework]
                     
                     # Generate automation code using the edited steps instead of generated_steps
-                    automation_code = generator_function(
-                        st.session_state.edited_steps,  # Use edited_steps instead of generated_steps
-                        st.session_state.history
-                    )
+                    stream_box = st.empty()
+                    show_partial_code = (lambda text: stream_box.code(text, language=code_language)) if stream_output else None
+                    with llm_ledger.run("codegen") as run_id, llm_stage(f"code_generation ({selected_framework})"):
+                        automation_code = generator_function(
+                            st.session_state.edited_steps,  # Use edited_steps instead of generated_steps
+                            st.session_state.history,
+                            on_text=show_partial_code,
+                            test_ir=shared_test_ir()
+                        )
+                    st.session_state.llm_run_id = run_id
+                    stream_box.empty()
                     
                     # Store in session state
                     st.session_state.automation_code = automation_code
@@ -845,15 +1081,6 @@ def main():
                     st.markdown('<div class="card code-container fade-in">', unsafe_allow_html=True)
                     st.markdown(f'<h3 class="glow-text">Generated {selected_framework} Automation Code</h3>', unsafe_allow_html=True)
                     
-                    # Use appropriate language for syntax highlighting
-                    code_language = "python"
-                    if selected_framework == "Cypress (JavaScript)":
-                        code_language = "javascript"
-                    elif selected_framework == "Robot Framework":
-                        code_language = "robot"
-                    elif selected_framework == "Selenium + Cucumber (Java)":
-                        code_language = "java"
-                    
                     st.code(automation_code, language=code_language)
                     st.markdown('</div>', unsafe_allow_html=True)
                     
@@ -880,6 +1107,18 @@ def main():
                     
                 except Exception as e:
                     st.markdown(f'<div class="status-error">Error generating {selected_framework} code: {str(e)}</div>', unsafe_allow_html=True)
+    
+    # Where the last action's time and money went, per LLM stage
+    if st.session_state.get("llm_run_id"):
+        breakdown = llm_ledger.breakdown(st.session_state.llm_run_id)
+        if breakdown:
+            with st.expander("LLM Usage for Last Action"):
+                import pandas as pd
+                st.dataframe(pd.DataFrame(breakdown))
+                st.caption(f"Total: {sum(row['Calls'] for row in breakdown)} calls, "
+                           f"{sum(row['Prompt Tokens'] + row['Completion Tokens'] for row in breakdown)} tokens, "
+                           f"${sum(row['Cost (USD)'] for row in breakdown):.4f} (run {st.session_state.llm_run_id}, "
+                           f"logged to {llm_ledger.path})")
 
 if __name__ == "__main__":
     main()
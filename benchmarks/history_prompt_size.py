@@ -0,0 +1,67 @@
+"""Execution history size in code-generation prompts: indented JSON vs. compact_history().
+
+Run from the repository root:
+
+    python -m benchmarks.history_prompt_size --steps 200
+"""
+import json
+import random
+import argparse
+
+from src.Utilities.history_compactor import (
+    HISTORY_TOKEN_BUDGET,
+    analyze_actions,
+    compact_history,
+    extract_selectors_from_history
+)
+from src.Utilities.token_budget import estimate_tokens
+
+def synthetic_history(steps, rng):
+    """A history shaped like the one execute_test() stores, dominated by repeated clicks"""
+    action_names = ["go_to_url"]
+    extracted_content = ["🔗  Navigated to https://shop.example"]
+    for step in range(steps):
+        roll = rng.random()
+        element = rng.randint(1, 25)
+        if roll < 0.6:
+            action_names.append("click_element")
+            extracted_content.append(f"🖱️  Clicked button with index {element}: ")
+        elif roll < 0.8:
+            action_names.append("input_text")
+            extracted_content.append(f"⌨️  Input search term into index {element}")
+        elif roll < 0.9:
+            action_names.append("get_xpath_of_element")
+            extracted_content.append(f"The xpath of the element is /html/body/div[1]/main/div[{element}]/button")
+        else:
+            action_names.append("verify_text")
+            extracted_content.append(f"Verified that result {step} is displayed")
+    return {
+        "urls": ["https://shop.example"],
+        "action_names": action_names,
+        "extracted_content": extracted_content
+    }
+
+def indented_history(history_data):
+    """The execution details section as the generators built it before compact_history()"""
+    return (
+        f"- Element selectors: {json.dumps(extract_selectors_from_history(history_data), indent=2)}\n"
+        f"- Actions performed: {json.dumps(analyze_actions(history_data), indent=2)}\n"
+        f"- Extracted content: {json.dumps(history_data.get('extracted_content', []), indent=2)}"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--steps", type=int, nargs="+", default=[20, 100, 500])
+    parser.add_argument("--budget", type=int, default=HISTORY_TOKEN_BUDGET)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    print(f"{'steps':>6} {'before (tokens)':>16} {'after (tokens)':>15} {'ratio':>6}")
+    for steps in args.steps:
+        history_data = synthetic_history(steps, rng)
+        before = estimate_tokens(indented_history(history_data))
+        after = estimate_tokens(compact_history(history_data, args.budget))
+        print(f"{steps:>6} {before:>16} {after:>15} {after / before:>6.0%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Memory used by discovered_pages as plain dicts vs. CompactPages.
+
+Run from the repository root:
+
+    python -m benchmarks.page_memory --pages 500
+"""
+import json
+import random
+import argparse
+import tracemalloc
+
+from src.Utilities.page_records import CompactPages
+
+def synthetic_page(index, rng):
+    """A page shaped like load_page_structure() output, with realistic attribute noise"""
+    classes = "btn btn-primary px-4 py-2 rounded-lg shadow-sm hover:bg-blue-600 focus:outline-none"
+    elements = []
+    for i in range(30):
+        tag = rng.choice(["a", "a", "a", "button", "input"])
+        attributes = {
+            "class": classes,
+            "data-track-id": f"{index}-{i}-{rng.random()}",
+            "style": "margin: 0 auto; display: inline-block;",
+            "data-v-3f2a9c1d": ""
+        }
+        element = {"tag": tag, "type": tag, "attributes": attributes, "text": f"Item {i} on page {index}"}
+        if tag == "a":
+            attributes["href"] = f"/products/{index * 30 + i}"
+            element["href"] = attributes["href"]
+        elif tag == "input":
+            attributes.update({"type": "text", "name": "q", "placeholder": "Search products"})
+            element.update({"input_type": "text", "name": "q", "placeholder": "Search products"})
+        else:
+            element["is_button"] = True
+        elements.append(element)
+    form = {
+        "inputs": [element for element in elements if element["tag"] == "input"][:8],
+        "submit": None,
+        "action": f"https://shop.example/search?page={index}",
+        "method": "get",
+        "likely_purpose": "search"
+    }
+    return {
+        "title": f"Product listing {index}",
+        "elements": elements,
+        "forms": [form],
+        "template": "2b5bf1266cbc",
+        "load_time_ms": rng.randint(100, 900),
+        "from_cache": False,
+        "fetch_mode": "static"
+    }
+
+def measure(build):
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    result = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=500)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    # Serialized first so neither representation shares strings with the generator
+    serialized = json.dumps({f"https://shop.example/p/{i}": synthetic_page(i, rng) for i in range(args.pages)})
+
+    plain, plain_bytes = measure(lambda: json.loads(serialized))
+    compact, compact_bytes = measure(lambda: CompactPages(json.loads(serialized)))
+
+    print(f"{args.pages} pages")
+    print(f"  dict pages:    {plain_bytes / 1024:10.1f} KiB")
+    print(f"  CompactPages:  {compact_bytes / 1024:10.1f} KiB  ({compact_bytes / plain_bytes:.0%} of dict)")
+    sample = next(iter(plain))
+    print(f"  round trip keeps page keys: {set(compact[sample]) == set(plain[sample])}")
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,164 @@
 import os
+import time
+import threading
+from contextlib import contextmanager
 from agno.agent import Agent
 from agno.models.openai import OpenAIChat
 from dotenv import load_dotenv
 load_dotenv()
 
+# Imported after load_dotenv so LLM_CACHE_* settings in .env are picked up
+from src.Utilities.llm_cache import LLMCache, cache_key
+from src.Utilities.llm_ledger import LLMLedger
+from src.Utilities.token_budget import estimate_tokens, hit_token_limit, reported_tokens
+
+STREAM_RENDER_INTERVAL = 0.1  # Seconds between UI updates while a response streams in
+
+class CachedResponse:
+    """Stand-in for an agno RunResponse replayed from the LLM cache"""
+
+    def __init__(self, content):
+        self.content = content
+        self.cached = True
+
+class CachedAgent:
+    """Wraps an agno Agent with the LLM cache and the LLM call ledger.
+
+    Calls are keyed by the model id, temperature, max_tokens and prompt (see
+    llm_cache.cache_key), so identical prompts are answered from the cache.
+    Responses cut off at max_tokens are not cached, and callers that reject
+    a response call forget() so the prompt goes to the model next time.
+    Every call, cached or not, is recorded in the ledger under the current
+    llm_stage. complete() adds a streaming path on top of the same cache.
+    Anything else is passed straight through to the wrapped agent.
+
+    An agno Agent keeps per-run state on itself, so calls made at the same
+    time (from the discovery pipeline's or code generation's worker threads)
+    each get their own copy of the agent, kept for reuse afterwards.
+    """
+
+    def __init__(self, agent, cache, ledger=None):
+        self.agent = agent
+        self.cache = cache
+        self.ledger = ledger
+        self._idle_agents = [agent]
+        self._agents_lock = threading.Lock()
+
+    @contextmanager
+    def _borrowed_agent(self):
+        with self._agents_lock:
+            agent = self._idle_agents.pop() if self._idle_agents else self.agent.deep_copy()
+        try:
+            yield agent
+        finally:
+            with self._agents_lock:
+                self._idle_agents.append(agent)
+
+    def _run(self, prompt, **kwargs):
+        if kwargs.get("stream"):
+            return self._stream(prompt, **kwargs)
+        with self._borrowed_agent() as agent:
+            return agent.run(prompt, **kwargs)
+
+    def _stream(self, prompt, **kwargs):
+        # The agent stays borrowed until the stream is consumed
+        with self._borrowed_agent() as agent:
+            yield from agent.run(prompt, **kwargs)
+
+    def _key(self, prompt):
+        model = self.agent.model
+        return cache_key(model.id, getattr(model, "temperature", None), getattr(model, "max_tokens", None), prompt)
+
+    def _cacheable(self, response):
+        return (isinstance(getattr(response, "content", None), str)
+                and not hit_token_limit(response, getattr(self.agent.model, "max_tokens", None)))
+
+    def forget(self, prompt):
+        """Drop a prompt's cached response, e.g. one that failed validation"""
+        if self.cache is not None and isinstance(prompt, str):
+            self.cache.delete(self._key(prompt))
+
+    def _record(self, prompt, response, started, cached):
+        if self.ledger is None or not isinstance(prompt, str):
+            return
+        content = getattr(response, "content", None)
+        prompt_tokens = None if cached else reported_tokens(response, ("input_tokens", "prompt_tokens"))
+        completion_tokens = None if cached else reported_tokens(response, ("output_tokens", "completion_tokens"))
+        estimated = prompt_tokens is None or completion_tokens is None
+        self.ledger.record(
+            self.agent.model.id,
+            prompt_tokens if prompt_tokens is not None else estimate_tokens(prompt),
+            completion_tokens if completion_tokens is not None else estimate_tokens(content if isinstance(content, str) else ""),
+            (time.perf_counter() - started) * 1000,
+            cached=cached,
+            estimated_tokens=estimated
+        )
+
+    def run(self, prompt, **kwargs):
+        started = time.perf_counter()
+        # Streaming and non-text prompts always go to the model
+        if self.cache is None or kwargs.get("stream") or not isinstance(prompt, str):
+            response = self._run(prompt, **kwargs)
+            if not kwargs.get("stream"):
+                self._record(prompt, response, started, cached=False)
+            return response
+        key = self._key(prompt)
+        content = self.cache.get(key)
+        if content is not None:
+            response = CachedResponse(content)
+            self._record(prompt, response, started, cached=True)
+            return response
+        response = self._run(prompt, **kwargs)
+        self._record(prompt, response, started, cached=False)
+        if self._cacheable(response):
+            self.cache.put(key, response.content)
+        return response
+
+    def complete(self, prompt, on_text=None, render_interval=STREAM_RENDER_INTERVAL):
+        """Response text for a prompt, optionally streamed as it is generated.
+
+        Without on_text this is run(prompt).content. With it, the response
+        is streamed and on_text is called with the text so far, at most once
+        per render_interval seconds plus once at the end. Both paths share the
+        cache and return the same text.
+        """
+        if on_text is None:
+            return self.run(prompt).content
+        started = time.perf_counter()
+        key = self._key(prompt) if self.cache is not None else None
+        content = self.cache.get(key) if key is not None else None
+        if content is not None:
+            self._record(prompt, CachedResponse(content), started, cached=True)
+            on_text(content)
+            return content
+        chunks = []
+        last_render = 0.0
+        for chunk in self._stream(prompt, stream=True):
+            delta = getattr(chunk, "content", None)
+            if not isinstance(delta, str) or not delta:
+                continue
+            chunks.append(delta)
+            if time.perf_counter() - last_render >= render_interval:
+                on_text("".join(chunks))
+                last_render = time.perf_counter()
+        content = "".join(chunks)
+        on_text(content)
+        # Streamed chunks carry no usage metrics, so the ledger gets estimated tokens
+        self._record(prompt, CachedResponse(content), started, cached=False)
+        if key is not None and self._cacheable(CachedResponse(content)):
+            self.cache.put(key, content)
+        return content
+
+    def __getattr__(self, name):
+        return getattr(self.agent, name)
+
+# One on-disk cache shared by both agents; set LLM_CACHE_DISABLED=1 to bypass it
+llm_cache = None if os.environ.get("LLM_CACHE_DISABLED") else LLMCache()
+# Every qa/code-gen/browser-agent call is logged here (see llm_ledger.py)
+llm_ledger = LLMLedger()
+
 # Initialize the agents with optimized parameters for comprehensive scenario generation
-qa_agent = Agent(
+qa_agent = CachedAgent(Agent(
     model=OpenAIChat(
         id="gpt-4o",
         api_key=os.environ.get("OPENAI_API_KEY"),
@@ -13,9 +166,9 @@ qa_agent = Agent(
         temperature=0.3   # Lower temperature for more concise output
     ),
     markdown=True,
-)
+), llm_cache, llm_ledger)
 
-code_gen_agent = Agent(
+code_gen_agent = CachedAgent(Agent(
     model=OpenAIChat(
         id="gpt-4o",
         api_key=os.environ.get("OPENAI_API_KEY"),
@@ -23,4 +176,4 @@ code_gen_agent = Agent(
         temperature=0.2   # Lower temperature for more focused code generation
     ),
     markdown=True,
-) 
\ No newline at end of file
+), llm_cache, llm_ledger)
@@ -1,16 +1,26 @@
-import streamlit as st
+import io
 import re
-from typing import Dict, Any
-import json
+import asyncio
+import zipfile
+import logging
+from typing import Dict, Any, Callable, Optional, Union
 
 from src.Agents.agents import (
     code_gen_agent
 )
+from src.Utilities.llm_ledger import llm_stage
 
-from src.Utilities.utils import (
-    extract_selectors_from_history,
-    analyze_actions,
-)
+from src.Utilities.test_ir import TestIR, build_test_ir
+from src.Utilities.code_templates import TEMPLATE_EMITTERS
+
+logger = logging.getLogger(__name__)
+
+MAX_CONCURRENT_CODEGEN_CALLS = 5  # One per framework
+
+# When template-generated code goes through the LLM afterwards
+POLISH_NEVER = "never"
+POLISH_UNSUPPORTED = "unsupported"  # Only when the templates couldn't express a recorded step
+POLISH_ALWAYS = "always"
 
 def generate_gherkin_scenarios(user_story: str) -> str:
     """Generate Gherkin scenarios from a user story"""
@@ -39,35 +49,25 @@ def extract_code_content(text: str) -> str:
         return match.group(1).strip()
     return text.strip()
 
-def generate_selenium_pytest_bdd(gherkin_steps: str, history_data: Dict[str, Any]) -> str:
+def generate_selenium_pytest_bdd(gherkin_steps: str, history_data: Dict[str, Any], on_text: Optional[Callable[[str], None]] = None,
+        test_ir: Optional[TestIR] = None) -> str:
     """Generate a single Python file with Selenium PyTest BDD automation code"""
     
-    # Extract feature name from Gherkin
-    feature_match = re.search(r"Feature:\s*(.+?)(?:\n|$)", gherkin_steps)
-    if feature_match:
-        feature_name = feature_match.group(1).strip().replace(" ", "_")
-    
-    # Extract selectors and actions
-    selectors = extract_selectors_from_history(history_data)
-    actions = analyze_actions(history_data)
-    
-    # Get URLs visited
-    urls = history_data.get('urls', [])
-    base_url = urls[0] if urls else "https://example.com"
+    # Selectors, steps and the compact history are derived once and can be shared between frameworks
+    test_ir = test_ir or build_test_ir(gherkin_steps, history_data)
     
     # Create prompt for Selenium PyTest BDD code
     code_file_prompt = f"""
     Generate a SINGLE Python file with Selenium PyTest BDD automation code based on the following Gherkin steps and browser interactions:
     
     ```gherkin
-    {gherkin_steps}
+    {test_ir.gherkin}
     ```
     
     Agent execution details:
-    - Base URL: {base_url}
-    - Element selectors: {json.dumps(selectors, indent=2)}
-    - Actions performed: {json.dumps(actions, indent=2)}
-    - Extracted content: {json.dumps(history_data.get('extracted_content', []), indent=2)}
+    - Base URL: {test_ir.base_url}
+    - Execution history (dense JSON; repeated actions and content are counted in "times"):
+    {test_ir.execution_history}
     
     Requirements:
     1. The file should include ALL necessary imports for Selenium and PyTest BDD
@@ -83,47 +83,28 @@ def generate_selenium_pytest_bdd(gherkin_steps: str, history_data: Dict[str, Any
     Return ONLY the Python code without any additional explanation.
     """
     
-    try:
-        # Generate the single file
-        code_response = code_gen_agent.run(code_file_prompt)
-        code_content = extract_code_content(code_response.content)
-        
-        return code_content
-        
-    except Exception as e:
-        st.error(f"Error generating Selenium PyTest BDD code: {str(e)}")
-        raise
+    # Generate the single file, streaming it to on_text if given
+    return extract_code_content(code_gen_agent.complete(code_file_prompt, on_text))
 
-def generate_playwright_python(gherkin_steps: str, history_data: Dict[str, Any]) -> str:
+def generate_playwright_python(gherkin_steps: str, history_data: Dict[str, Any], on_text: Optional[Callable[[str], None]] = None,
+        test_ir: Optional[TestIR] = None) -> str:
     """Generate a single Python file with Playwright automation code"""
     
-    # Extract feature name from Gherkin
-    feature_name = "Automated_Test"
-    feature_match = re.search(r"Feature:\s*(.+?)(?:\n|$)", gherkin_steps)
-    if feature_match:
-        feature_name = feature_match.group(1).strip().replace(" ", "_")
-    
-    # Extract selectors and actions
-    selectors = extract_selectors_from_history(history_data)
-    actions = analyze_actions(history_data)
-    
-    # Get URLs visited
-    urls = history_data.get('urls', [])
-    base_url = urls[0] if urls else "https://example.com"
+    # Selectors, steps and the compact history are derived once and can be shared between frameworks
+    test_ir = test_ir or build_test_ir(gherkin_steps, history_data)
     
     # Create prompt for Playwright code
     code_file_prompt = f"""
     Generate a SINGLE Python file with Playwright automation code based on the following Gherkin steps and browser interactions:
     
     ```gherkin
-    {gherkin_steps}
+    {test_ir.gherkin}
     ```
     
     Agent execution details:
-    - Base URL: {base_url}
-    - Element selectors: {json.dumps(selectors, indent=2)}
-    - Actions performed: {json.dumps(actions, indent=2)}
-    - Extracted content: {json.dumps(history_data.get('extracted_content', []), indent=2)}
+    - Base URL: {test_ir.base_url}
+    - Execution history (dense JSON; repeated actions and content are counted in "times"):
+    {test_ir.execution_history}
     
     Requirements:
     1. The file should include ALL necessary imports for Playwright
@@ -139,47 +120,28 @@ def generate_playwright_python(gherkin_steps: str, history_data: Dict[str, Any])
     Return ONLY the Python code without any additional explanation.
     """
     
-    try:
-        # Generate the single file
-        code_response = code_gen_agent.run(code_file_prompt)
-        code_content = extract_code_content(code_response.content)
-        
-        return code_content
-        
-    except Exception as e:
-        st.error(f"Error generating Playwright code: {str(e)}")
-        raise
+    # Generate the single file, streaming it to on_text if given
+    return extract_code_content(code_gen_agent.complete(code_file_prompt, on_text))
 
-def generate_cypress_js(gherkin_steps: str, history_data: Dict[str, Any]) -> str:
+def generate_cypress_js(gherkin_steps: str, history_data: Dict[str, Any], on_text: Optional[Callable[[str], None]] = None,
+        test_ir: Optional[TestIR] = None) -> str:
     """Generate a single JavaScript file with Cypress automation code"""
     
-    # Extract feature name from Gherkin
-    feature_name = "Automated_Test"
-    feature_match = re.search(r"Feature:\s*(.+?)(?:\n|$)", gherkin_steps)
-    if feature_match:
-        feature_name = feature_match.group(1).strip().replace(" ", "_")
-    
-    # Extract selectors and actions
-    selectors = extract_selectors_from_history(history_data)
-    actions = analyze_actions(history_data)
-    
-    # Get URLs visited
-    urls = history_data.get('urls', [])
-    base_url = urls[0] if urls else "https://example.com"
+    # Selectors, steps and the compact history are derived once and can be shared between frameworks
+    test_ir = test_ir or build_test_ir(gherkin_steps, history_data)
     
     # Create prompt for Cypress code
     code_file_prompt = f"""
     Generate a SINGLE JavaScript file with Cypress test automation code based on the following Gherkin steps and browser interactions:
     
     ```gherkin
-    {gherkin_steps}
+    {test_ir.gherkin}
     ```
     
     Agent execution details:
-    - Base URL: {base_url}
-    - Element selectors: {json.dumps(selectors, indent=2)}
-    - Actions performed: {json.dumps(actions, indent=2)}
-    - Extracted content: {json.dumps(history_data.get('extracted_content', []), indent=2)}
+    - Base URL: {test_ir.base_url}
+    - Execution history (dense JSON; repeated actions and content are counted in "times"):
+    {test_ir.execution_history}
     
     Requirements:
     1. The file should be ready to use with Cypress
@@ -193,47 +155,28 @@ def generate_cypress_js(gherkin_steps: str, history_data: Dict[str, Any]) -> str
     Return ONLY the JavaScript code without any additional explanation.
     """
     
-    try:
-        # Generate the single file
-        code_response = code_gen_agent.run(code_file_prompt)
-        code_content = extract_code_content(code_response.content)
-        
-        return code_content
-        
-    except Exception as e:
-        st.error(f"Error generating Cypress code: {str(e)}")
-        raise
+    # Generate the single file, streaming it to on_text if given
+    return extract_code_content(code_gen_agent.complete(code_file_prompt, on_text))
 
-def generate_robot_framework(gherkin_steps: str, history_data: Dict[str, Any]) -> str:
+def generate_robot_framework(gherkin_steps: str, history_data: Dict[str, Any], on_text: Optional[Callable[[str], None]] = None,
+        test_ir: Optional[TestIR] = None) -> str:
     """Generate Robot Framework test file"""
     
-    # Extract feature name from Gherkin
-    feature_name = "Automated_Test"
-    feature_match = re.search(r"Feature:\s*(.+?)(?:\n|$)", gherkin_steps)
-    if feature_match:
-        feature_name = feature_match.group(1).strip().replace(" ", "_")
-    
-    # Extract selectors and actions
-    selectors = extract_selectors_from_history(history_data)
-    actions = analyze_actions(history_data)
-    
-    # Get URLs visited
-    urls = history_data.get('urls', [])
-    base_url = urls[0] if urls else "https://example.com"
+    # Selectors, steps and the compact history are derived once and can be shared between frameworks
+    test_ir = test_ir or build_test_ir(gherkin_steps, history_data)
     
     # Create prompt for Robot Framework code
     code_file_prompt = f"""
     Generate a Robot Framework (.robot) test file based on the following Gherkin steps and browser interactions:
     
     ```gherkin
-    {gherkin_steps}
+    {test_ir.gherkin}
     ```
     
     Agent execution details:
-    - Base URL: {base_url}
-    - Element selectors: {json.dumps(selectors, indent=2)}
-    - Actions performed: {json.dumps(actions, indent=2)}
-    - Extracted content: {json.dumps(history_data.get('extracted_content', []), indent=2)}
+    - Base URL: {test_ir.base_url}
+    - Execution history (dense JSON; repeated actions and content are counted in "times"):
+    {test_ir.execution_history}
     
     Requirements:
     1. The file should follow Robot Framework syntax and structure
@@ -246,47 +189,28 @@ def generate_robot_framework(gherkin_steps: str, history_data: Dict[str, Any]) -
     Return ONLY the Robot Framework code without any additional explanation.
     """
     
-    try:
-        # Generate the single file
-        code_response = code_gen_agent.run(code_file_prompt)
-        code_content = extract_code_content(code_response.content)
-        
-        return code_content
-        
-    except Exception as e:
-        st.error(f"Error generating Robot Framework code: {str(e)}")
-        raise
+    # Generate the single file, streaming it to on_text if given
+    return extract_code_content(code_gen_agent.complete(code_file_prompt, on_text))
 
-def generate_java_selenium(gherkin_steps: str, history_data: Dict[str, Any]) -> str:
+def generate_java_selenium(gherkin_steps: str, history_data: Dict[str, Any], on_text: Optional[Callable[[str], None]] = None,
+        test_ir: Optional[TestIR] = None) -> str:
     """Generate a Java file with Selenium and Cucumber automation code"""
     
-    # Extract feature name from Gherkin
-    feature_name = "Automated_Test"
-    feature_match = re.search(r"Feature:\s*(.+?)(?:\n|$)", gherkin_steps)
-    if feature_match:
-        feature_name = feature_match.group(1).strip().replace(" ", "_")
-    
-    # Extract selectors and actions
-    selectors = extract_selectors_from_history(history_data)
-    actions = analyze_actions(history_data)
-    
-    # Get URLs visited
-    urls = history_data.get('urls', [])
-    base_url = urls[0] if urls else "https://example.com"
+    # Selectors, steps and the compact history are derived once and can be shared between frameworks
+    test_ir = test_ir or build_test_ir(gherkin_steps, history_data)
     
     # Create prompt for Java Selenium Cucumber code
     code_file_prompt = f"""
     Generate a Java implementation for Selenium with Cucumber based on the following Gherkin steps and browser interactions:
     
     ```gherkin
-    {gherkin_steps}
+    {test_ir.gherkin}
     ```
     
     Agent execution details:
-    - Base URL: {base_url}
-    - Element selectors: {json.dumps(selectors, indent=2)}
-    - Actions performed: {json.dumps(actions, indent=2)}
-    - Extracted content: {json.dumps(history_data.get('extracted_content', []), indent=2)}
+    - Base URL: {test_ir.base_url}
+    - Execution history (dense JSON; repeated actions and content are counted in "times"):
+    {test_ir.execution_history}
     
     Requirements:
     1. Create a complete Java implementation with proper package structure
@@ -300,14 +224,86 @@ def generate_java_selenium(gherkin_steps: str, history_data: Dict[str, Any]) ->
     Return ONLY the Java code without any additional explanation.
     """
     
-    try:
-        # Generate the single file
-        code_response = code_gen_agent.run(code_file_prompt)
-        code_content = extract_code_content(code_response.content)
-        
-        return code_content
-        
-    except Exception as e:
-        st.error(f"Error generating Java Selenium Cucumber code: {str(e)}")
-        raise
+    # Generate the single file, streaming it to on_text if given
+    return extract_code_content(code_gen_agent.complete(code_file_prompt, on_text))
+
+def polish_generated_code(framework: str, code: str, test_ir: TestIR, unsupported,
+        on_text: Optional[Callable[[str], None]] = None) -> str:
+    """Ask the LLM to improve template-generated code without changing what it tests"""
+    missing_steps = "\n".join(f"    - {step}" for step in unsupported) or "    - None"
+    polish_prompt = f"""
+    Improve the following {framework} test code, which was generated from templates over recorded browser actions.
+    
+    ```
+    {code}
+    ```
+    
+    Recorded steps the templates could not express (replace their TODO comments with working code):
+{missing_steps}
+    
+    Agent execution details:
+    - Base URL: {test_ir.base_url}
+    - Execution history (dense JSON; repeated actions and content are counted in "times"):
+    {test_ir.execution_history}
+    
+    Requirements:
+    1. Keep every recorded action, selector, value and assertion
+    2. Keep the file structure, test names and step texts
+    3. Add wait strategies and clear comments where they help
+    4. Keep it a single, self-contained file that can be run directly
+    
+    Return ONLY the code without any additional explanation.
+    """
+    return extract_code_content(code_gen_agent.complete(polish_prompt, on_text))
+
+def template_generator(framework: str, polish: str = POLISH_UNSUPPORTED) -> Callable:
+    """Generator with the same signature as generate_playwright_python etc.
+    that writes the code from templates, using the LLM only as a polish pass
+    """
+    emitter = TEMPLATE_EMITTERS[framework]
+
+    def generate(gherkin_steps: str, history_data: Dict[str, Any], on_text: Optional[Callable[[str], None]] = None,
+            test_ir: Optional[TestIR] = None) -> str:
+        test_ir = test_ir or build_test_ir(gherkin_steps, history_data)
+        code, unsupported = emitter(test_ir)
+        if polish == POLISH_ALWAYS or (polish == POLISH_UNSUPPORTED and unsupported):
+            try:
+                return polish_generated_code(framework, code, test_ir, unsupported, on_text)
+            except Exception as e:
+                logger.warning(f"LLM polish of {framework} code failed, using the template code: {str(e)}")
+        if on_text is not None:
+            on_text(code)
+        return code
+
+    return generate
+
+async def generate_all_frameworks(generators: Dict[str, Callable], test_ir: TestIR,
+        max_concurrency: int = MAX_CONCURRENT_CODEGEN_CALLS) -> Dict[str, Union[str, Exception]]:
+    """Run every framework's generator on one shared TestIR concurrently.
+
+    Returns {framework: code}, with the exception in place of the code for
+    frameworks whose generation failed. Generators run in worker threads,
+    so they raise rather than report to the page; the caller shows errors.
+    """
+    slots = asyncio.Semaphore(max_concurrency)
+
+    async def generate(framework, generator):
+        async with slots:
+            with llm_stage(f"code_generation ({framework})"):
+                try:
+                    return framework, await asyncio.to_thread(generator, test_ir.gherkin, {}, test_ir=test_ir)
+                except Exception as e:
+                    return framework, e
+
+    return dict(await asyncio.gather(*(generate(framework, generator) for framework, generator in generators.items())))
 
+def bundle_generated_code(test_ir: TestIR, codes: Dict[str, str], extensions: Dict[str, str]) -> bytes:
+    """Zip with the feature file and one folder per framework"""
+    file_stem = re.sub(r"[^a-z0-9]+", "_", test_ir.feature_name.lower()).strip("_") or "automated_test"
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as bundle:
+        bundle.writestr(f"{file_stem}.feature", test_ir.gherkin)
+        for framework, code in codes.items():
+            folder = re.sub(r"[^a-z0-9]+", "_", framework.lower()).strip("_")
+            bundle.writestr(f"{folder}/{file_stem}_automation.{extensions[framework]}", code)
+    return buffer.getvalue()
@@ -0,0 +1,260 @@
+import re
+from typing import Dict, List, Tuple
+
+from src.Utilities.test_ir import TestIR, TestStep, split_scenarios
+
+# Step kinds with no effect on the page; they are left out of the generated code
+SILENT_KINDS = {"locate", "read", "done"}
+SCROLL_PIXELS = 600
+QUOTED_TEXT = re.compile(r'"([^"]+)"')
+PLACEHOLDER = re.compile(r"<[^<>\s]+>")  # Scenario Outline parameter, filled in from Examples
+STEP_KEYWORDS = ("Given", "When", "Then", "And", "But")
+
+def parse_scenarios(gherkin: str) -> List[Dict]:
+    """Scenarios in order as {"title", "outline", "steps": [(keyword, text), ...]}.
+
+    And/But steps take the keyword of the step before them. Scenarios come
+    from split_scenarios(), the same splitter execute_test() uses, so the
+    scenario numbers on recorded steps line up. outline is True for a
+    Scenario Outline/Template, whose steps keep their <placeholders>.
+    """
+    scenarios = []
+    for scenario_text in split_scenarios(gherkin):
+        heading, *lines = scenario_text.split("\n")
+        keyword, title = heading.split(":", 1)
+        scenario = {"title": title.strip(), "outline": keyword.strip() != "Scenario", "steps": []}
+        keyword = "Given"
+        for line in lines:
+            line = line.strip()
+            if line.split(" ", 1)[0] in STEP_KEYWORDS and " " in line:
+                word, text = line.split(" ", 1)
+                if word not in ("And", "But"):
+                    keyword = word
+                scenario["steps"].append((keyword, text.strip()))
+        scenarios.append(scenario)
+    return scenarios
+
+def expected_texts(scenario: Dict) -> List[str]:
+    """Quoted strings in the scenario's Then steps, asserted as visible page text.
+
+    Strings with an outline <placeholder> are left out; their value depends
+    on the Examples row.
+    """
+    return [
+        text for keyword, step in scenario["steps"] if keyword == "Then"
+        for text in QUOTED_TEXT.findall(step) if not PLACEHOLDER.search(text)
+    ]
+
+def _outline_unsupported(number: int, scenario: Dict) -> List[str]:
+    if not scenario["outline"]:
+        return []
+    return [f"Scenario {number}: Scenario Outline {scenario['title']!r} is emitted once, without its Examples values"]
+
+def _identifier(text: str, fallback: str) -> str:
+    identifier = re.sub(r"\W+", "_", text.lower()).strip("_")[:60]
+    return identifier if identifier and not identifier[0].isdigit() else fallback
+
+def _xpath(step: TestStep) -> str:
+    # browser-use reports XPaths relative to the document, e.g. html/body/div
+    return step.xpath if step.xpath.startswith(("/", "(")) else "/" + step.xpath
+
+def _scenario_steps(test_ir: TestIR, scenario_count: int) -> List[List[TestStep]]:
+    steps = [[] for _ in range(max(scenario_count, 1))]
+    for step in test_ir.steps:
+        steps[min(step.scenario, len(steps) - 1)].append(step)
+    return steps
+
+def _playwright_line(step: TestStep):
+    """Playwright statement for a recorded step, or None if there's no template for it"""
+    if step.kind == "navigate" and step.value:
+        return f"page.goto({step.value!r})"
+    if step.kind == "back":
+        return "page.go_back()"
+    if step.kind == "press" and step.value:
+        return f"page.keyboard.press({step.value!r})"
+    if step.kind == "scroll":
+        return f"page.mouse.wheel(0, {-SCROLL_PIXELS if step.action == 'scroll_up' else SCROLL_PIXELS})"
+    if step.kind == "wait":
+        return f"page.wait_for_timeout({int(float(step.value or 1) * 1000)})"
+    if step.xpath is None:
+        return None
+    locator = f"page.locator({'xpath=' + _xpath(step)!r})"
+    if step.kind == "fill" and step.value is not None:
+        return f"{locator}.fill({step.value!r})"
+    if step.kind == "click":
+        return f"{locator}.click()"
+    if step.kind == "hover":
+        return f"{locator}.hover()"
+    return None
+
+def _docstring(gherkin: str) -> str:
+    # Gherkin from the editor may still be wrapped in a markdown code fence
+    feature = "\n".join(line for line in gherkin.strip().splitlines() if not line.strip().startswith("```"))
+    return '"""\n' + feature.replace("\\", "\\\\").replace('"""', '\\"\\"\\"').strip() + '\n"""'
+
+def emit_playwright_python(test_ir: TestIR) -> Tuple[str, List[str]]:
+    """Playwright (sync API) test module with one test per scenario.
+
+    Returns the code and a description of every recorded step no template
+    covers; those are left as TODO comments in the code.
+    """
+    scenarios = parse_scenarios(test_ir.gherkin) or [{"title": test_ir.feature_name, "steps": []}]
+    unsupported = []
+    tests = []
+    for number, (scenario, steps) in enumerate(zip(scenarios, _scenario_steps(test_ir, len(scenarios))), start=1):
+        unsupported += _outline_unsupported(number, scenario)
+        name = f"test_{number}_{_identifier(scenario['title'], 'scenario')}"
+        body = ["    page.goto(BASE_URL)"] if not steps or steps[0].kind != "navigate" else []
+        for step in steps:
+            if step.kind in SILENT_KINDS:
+                continue
+            line = _playwright_line(step)
+            if line is None:
+                unsupported.append(f"Scenario {number}: {step.action} {step.model_dump(exclude_none=True)}")
+                line = f"# TODO: no template for recorded action {step.action!r}"
+            body.append(f"    {line}")
+        body += [f"    expect(page.locator(\"body\")).to_contain_text({text!r})" for text in expected_texts(scenario)]
+        tests.append((name, scenario["title"], body))
+
+    lines = [
+        _docstring(test_ir.gherkin),
+        "from playwright.sync_api import Page, expect, sync_playwright",
+        "",
+        f"BASE_URL = {test_ir.base_url!r}",
+        ""
+    ]
+    for name, title, body in tests:
+        lines += ["", f"def {name}(page: Page):", f"    # Scenario: {title}", *body, ""]
+    lines += [
+        "",
+        "# Run with `pytest` (pytest-playwright provides the page fixture) or directly",
+        "if __name__ == \"__main__\":",
+        "    with sync_playwright() as playwright:",
+        "        browser = playwright.chromium.launch()",
+        f"        for test in ({', '.join(name for name, _, _ in tests)},):",
+        "            page = browser.new_page()",
+        "            test(page)",
+        "            page.close()",
+        "        browser.close()",
+        ""
+    ]
+    return "\n".join(lines), unsupported
+
+def _selenium_lines(step: TestStep):
+    """Selenium statements for a recorded step, or None if there's no template for it"""
+    if step.kind == "navigate" and step.value:
+        return [f"driver.get({step.value!r})"]
+    if step.kind == "back":
+        return ["driver.back()"]
+    if step.kind == "press" and step.value:
+        return [f"ActionChains(driver).send_keys(getattr(Keys, {step.value.upper()!r}, {step.value!r})).perform()"]
+    if step.kind == "scroll":
+        return [f"driver.execute_script(\"window.scrollBy(0, {-SCROLL_PIXELS if step.action == 'scroll_up' else SCROLL_PIXELS})\")"]
+    if step.kind == "wait":
+        return [f"time.sleep({float(step.value or 1)})"]
+    if step.xpath is None:
+        return None
+    xpath = _xpath(step)
+    if step.kind == "fill" and step.value is not None:
+        return [f"element = wait_for(driver, {xpath!r})", "element.clear()", f"element.send_keys({step.value!r})"]
+    if step.kind == "click":
+        return [f"wait_for(driver, {xpath!r}, EC.element_to_be_clickable).click()"]
+    if step.kind == "hover":
+        return [f"ActionChains(driver).move_to_element(wait_for(driver, {xpath!r})).perform()"]
+    return None
+
+def emit_selenium_pytest_bdd(test_ir: TestIR) -> Tuple[str, List[str]]:
+    """pytest-bdd module with Selenium step definitions for every Gherkin step.
+
+    Each scenario's recorded actions go into its first When step (or its
+    first step if it has none); quoted text in Then steps is asserted on
+    the page; other steps are no-ops. The feature file is written next to
+    the module so it runs on its own. Returns the code and the recorded
+    steps no template covers.
+    """
+    scenarios = parse_scenarios(test_ir.gherkin)
+    unsupported = [] if scenarios else ["The Gherkin has no scenarios to bind step definitions to"]
+    definitions = {}  # (keyword, text) -> body lines
+    for number, (scenario, steps) in enumerate(zip(scenarios, _scenario_steps(test_ir, len(scenarios))), start=1):
+        unsupported += _outline_unsupported(number, scenario)
+        if not scenario["steps"]:
+            continue
+        action_step = next((step for step in scenario["steps"] if step[0] == "When"), scenario["steps"][0])
+        body = []
+        for step in steps:
+            if step.kind in SILENT_KINDS:
+                continue
+            step_lines = _selenium_lines(step)
+            if step_lines is None:
+                unsupported.append(f"Scenario {number}: {step.action} {step.model_dump(exclude_none=True)}")
+                step_lines = [f"# TODO: no template for recorded action {step.action!r}"]
+            body += step_lines
+        for keyword, text in scenario["steps"]:
+            expected = [quoted for quoted in QUOTED_TEXT.findall(text) if not PLACEHOLDER.search(quoted)]
+            if keyword == "Then" and expected:
+                lines = ["body_text = driver.find_element(By.TAG_NAME, \"body\").text"]
+                lines += [f"assert {quoted!r} in body_text" for quoted in expected]
+            elif (keyword, text) == action_step:
+                lines = body
+            else:
+                lines = []
+            known = definitions.get((keyword, text))
+            if not known:
+                definitions[(keyword, text)] = lines
+            elif lines and lines != known:
+                unsupported.append(f"Scenario {number}: step {text!r} is reused with different recorded actions")
+
+    lines = [
+        _docstring(test_ir.gherkin),
+        "import time",
+        "from pathlib import Path",
+        "",
+        "import pytest",
+        "from pytest_bdd import given, when, then, scenarios",
+        "from selenium import webdriver",
+        "from selenium.webdriver.common.action_chains import ActionChains",
+        "from selenium.webdriver.common.by import By",
+        "from selenium.webdriver.common.keys import Keys",
+        "from selenium.webdriver.support import expected_conditions as EC",
+        "from selenium.webdriver.support.ui import WebDriverWait",
+        "",
+        f"BASE_URL = {test_ir.base_url!r}",
+        "WAIT_SECONDS = 10",
+        "",
+        "FEATURE_FILE = Path(__file__).with_suffix(\".feature\")",
+        "FEATURE_FILE.write_text(__doc__, encoding=\"utf-8\")",
+        "scenarios(str(FEATURE_FILE))",
+        "",
+        "",
+        "@pytest.fixture",
+        "def driver():",
+        "    driver = webdriver.Chrome()",
+        "    driver.get(BASE_URL)",
+        "    yield driver",
+        "    driver.quit()",
+        "",
+        "",
+        "def wait_for(driver, xpath, condition=EC.presence_of_element_located):",
+        "    return WebDriverWait(driver, WAIT_SECONDS).until(condition((By.XPATH, xpath)))",
+        ""
+    ]
+    names = set()
+    for (keyword, text), body in definitions.items():
+        name = _identifier(text, "step")
+        while name in names:
+            name += "_"
+        names.add(name)
+        lines += [
+            "",
+            f"@{keyword.lower()}({text!r})",
+            f"def {name}(driver):",
+            *(f"    {line}" for line in body or ["pass"]),
+            ""
+        ]
+    return "\n".join(lines), unsupported
+
+# Frameworks that can be generated without the LLM, by their FRAMEWORK_GENERATORS name
+TEMPLATE_EMITTERS = {
+    "Playwright (Python)": emit_playwright_python,
+    "Selenium + PyTest BDD (Python)": emit_selenium_pytest_bdd
+}
@@ -0,0 +1,113 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import logging
+from typing import Dict, Any, Optional
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.environ.get("DISCOVERY_CACHE_DIR", ".discovery_cache")
+CACHE_DB_NAME = "crawl_cache_v3.sqlite3"  # Bump when the extraction payload changes shape
+REVALIDATE_TIMEOUT = 10  # seconds for conditional GET requests
+
+def content_hash(body) -> str:
+    """Stable hash of a page's raw HTML"""
+    if isinstance(body, str):
+        body = body.encode("utf-8", errors="replace")
+    return hashlib.sha256(body).hexdigest()
+
+class CrawlCache:
+    """SQLite cache of extracted page structure keyed by canonical URL.
+
+    Each entry keeps the validators needed for an incremental re-crawl
+    (ETag, Last-Modified and a hash of the HTML) next to the extracted page
+    data and its raw links, so an unchanged page can be reused without
+    loading it in the browser or re-running extraction.
+    """
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.path = os.path.join(self.cache_dir, CACHE_DB_NAME)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                content_hash TEXT,
+                page_data TEXT NOT NULL,
+                links TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+        self._session = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        row = self._conn.execute(
+            "SELECT etag, last_modified, content_hash, page_data, links FROM pages WHERE url = ?", (url,)
+        ).fetchone()
+        if not row:
+            return None
+        return {
+            "etag": row[0],
+            "last_modified": row[1],
+            "content_hash": row[2],
+            "page_data": json.loads(row[3]),
+            "links": json.loads(row[4])
+        }
+
+    def put(self, url, page_data, links, etag=None, last_modified=None, html_hash=None):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO pages (url, etag, last_modified, content_hash, page_data, links, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (url, etag, last_modified, html_hash, json.dumps(page_data), json.dumps(links), time.time())
+        )
+        self._conn.commit()
+
+    def touch(self, url):
+        self._conn.execute("UPDATE pages SET updated_at = ? WHERE url = ?", (time.time(), url))
+        self._conn.commit()
+
+    @staticmethod
+    def revalidation_headers(entry) -> Dict[str, str]:
+        """Conditional GET headers for a cached entry; empty if it can't be revalidated"""
+        headers = {}
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    async def is_unchanged(self, url, entry) -> bool:
+        """Ask the server whether a cached page changed, using a conditional GET.
+
+        Only pages that were stored with an ETag or Last-Modified header can be
+        revalidated this way (see revalidation_headers); anything else has to
+        be loaded to compare hashes, and no request is sent.
+        """
+        headers = self.revalidation_headers(entry)
+        if not headers:
+            return False
+
+        if self._session is None:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=REVALIDATE_TIMEOUT))
+        try:
+            async with self._session.get(url, headers=headers, allow_redirects=False) as response:
+                return response.status == 304
+        except Exception as e:
+            logger.debug(f"Revalidation failed for {url}: {str(e)}")
+            return False
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        self._conn.close()
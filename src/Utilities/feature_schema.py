@@ -0,0 +1,52 @@
+import re
+import json
+from typing import Dict, List, Literal
+
+from pydantic import BaseModel, Field
+
+FeatureType = Literal["navigation", "form", "interaction", "validation", "content"]
+
+class PageFeature(BaseModel):
+    name: str = Field(description="Descriptive name for the feature (max 10 words)")
+    type: FeatureType
+    description: str = Field(description="What user goal this feature serves (max 15 words)")
+    edge_cases: List[str] = Field(default_factory=list, description="1-3 potential edge cases to test")
+
+class PageFeatures(BaseModel):
+    features: List[PageFeature] = Field(min_length=1)
+
+class BatchedPageFeatures(BaseModel):
+    pages: Dict[str, PageFeatures] = Field(description="Features of each page, keyed by page URL")
+
+# Models often wrap JSON in a markdown fence even when told not to
+CODE_FENCE = re.compile(r"```(?:json)?\s*(.*?)```", re.DOTALL)
+
+def feature_schema_json(batched=False) -> str:
+    """Compact JSON schema of the expected response, for the prompt"""
+    model = BatchedPageFeatures if batched else PageFeatures
+    return json.dumps(model.model_json_schema(), separators=(",", ":"))
+
+def _load_json(content: str):
+    fenced = CODE_FENCE.search(content)
+    return json.loads((fenced.group(1) if fenced else content).strip())
+
+def parse_page_features(content: str) -> List[dict]:
+    """Validate a model response against PageFeatures.
+
+    Accepts the object itself or a bare array of features, optionally inside
+    a code fence. Raises ValueError (pydantic's ValidationError included) if
+    the response doesn't match the schema.
+    """
+    data = _load_json(content)
+    if isinstance(data, list):
+        data = {"features": data}
+    return [feature.model_dump() for feature in PageFeatures.model_validate(data).features]
+
+def parse_batched_page_features(content: str) -> Dict[str, List[dict]]:
+    """Validate a multi-page response against BatchedPageFeatures.
+
+    Returns {page URL: [feature, ...]}; the caller checks which of its pages
+    are missing.
+    """
+    pages = BatchedPageFeatures.model_validate(_load_json(content)).pages
+    return {url: [feature.model_dump() for feature in page.features] for url, page in pages.items()}
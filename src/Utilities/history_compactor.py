@@ -0,0 +1,135 @@
+import os
+import re
+import json
+from typing import Dict, Any, List
+
+from src.Utilities.token_budget import estimate_tokens
+
+# Token budget of the execution history section of a code-generation prompt
+HISTORY_TOKEN_BUDGET = int(os.environ.get("HISTORY_TOKEN_BUDGET", "1500"))
+MAX_CONTENT_LENGTH = 300  # Longer extracted content entries are cut to this many characters
+XPATH_CONTENT = re.compile(r"The xpath of the element is (.*)")
+VERIFICATION_WORDS = ("verif", "assert", "expect", "check", "found", "visible", "displayed")
+
+# Helper functions for code generation
+def extract_selectors_from_history(history_data: Dict[str, Any]) -> Dict[str, str]:
+    """Extract element selectors from agent history"""
+    selectors = {}
+
+    for content in history_data.get('extracted_content', []):
+        if isinstance(content, str):
+            match = XPATH_CONTENT.search(content)
+            if match:
+                xpath = match.group(1)
+                # Create a meaningful name based on surrounding context
+                name = "element_" + str(len(selectors) + 1)
+                selectors[name] = xpath
+
+    return selectors
+
+def analyze_actions(history_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Analyze the actions performed by the agent to create step implementations"""
+    actions = []
+
+    for i, action_name in enumerate(history_data.get('action_names', [])):
+        action_info = {
+            "name": action_name,
+            "index": i,
+            "type": "unknown"
+        }
+
+        # Determine action type
+        if "navigate" in action_name.lower() or "goto" in action_name.lower():
+            action_info["type"] = "navigation"
+        elif "click" in action_name.lower():
+            action_info["type"] = "click"
+        elif "type" in action_name.lower() or "fill" in action_name.lower() or "enter" in action_name.lower():
+            action_info["type"] = "input"
+        elif "check" in action_name.lower() or "verify" in action_name.lower() or "assert" in action_name.lower():
+            action_info["type"] = "verification"
+        elif "get xpath" in action_name.lower():
+            action_info["type"] = "xpath"
+        elif "save job details" in action_name.lower():
+            action_info["type"] = "custom_save"
+
+        actions.append(action_info)
+
+    return actions
+
+def _dense(value) -> str:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+def collapse_actions(actions: List[Dict[str, Any]]) -> List[list]:
+    """Runs of the same action become one [name, type, first index, times] entry"""
+    runs = []
+    for action in actions:
+        if runs and runs[-1][0] == action["name"]:
+            runs[-1][3] += 1
+        else:
+            runs.append([action["name"], action["type"], action["index"], 1])
+    return runs
+
+def dedupe_content(extracted_content: List[Any]) -> List[list]:
+    """Distinct extracted content as [text, times], in first-seen order.
+
+    XPath reports are dropped since the selectors already carry them.
+    """
+    counts = {}
+    for content in extracted_content:
+        if content is None:
+            continue
+        text = content if isinstance(content, str) else _dense(content)
+        text = text.strip()
+        if not text or XPATH_CONTENT.search(text):
+            continue
+        if len(text) > MAX_CONTENT_LENGTH:
+            text = text[:MAX_CONTENT_LENGTH] + "..."
+        counts[text] = counts.get(text, 0) + 1
+    return [[text, times] for text, times in counts.items()]
+
+def _is_verification(text: str) -> bool:
+    lowered = text.lower()
+    return any(word in lowered for word in VERIFICATION_WORDS)
+
+def compact_history(history_data: Dict[str, Any], token_budget: int = HISTORY_TOKEN_BUDGET) -> str:
+    """Execution history for a code-generation prompt, within token_budget.
+
+    Selectors are deduplicated by XPath, runs of the same action are
+    collapsed and repeated extracted content is counted instead of repeated,
+    all in dense JSON. If that is still over budget, entries are kept in
+    priority order (selectors, then verification actions and content, then
+    the rest) and the number left out is noted.
+    """
+    selectors = {}
+    for name, xpath in extract_selectors_from_history(history_data).items():
+        if xpath not in selectors.values():
+            selectors[name] = xpath
+    action_runs = collapse_actions(analyze_actions(history_data))
+    content = dedupe_content(history_data.get('extracted_content', []))
+
+    # (priority, section, position, entry); lower priority numbers are kept first
+    entries = [(0, "selectors", i, item) for i, item in enumerate(selectors.items())]
+    entries += [(1 if run[1] == "verification" else 2, "actions", i, run) for i, run in enumerate(action_runs)]
+    entries += [(1 if _is_verification(item[0]) else 3, "content", i, item) for i, item in enumerate(content)]
+
+    kept = {"selectors": [], "actions": [], "content": []}
+    used = 0
+    for _, name, position, entry in sorted(entries, key=lambda entry: entry[:3]):
+        tokens = estimate_tokens(_dense(entry))
+        if used + tokens > token_budget:
+            continue
+        kept[name].append((position, entry))
+        used += tokens
+
+    def section(name):
+        return [entry for _, entry in sorted(kept[name], key=lambda item: item[0])]
+
+    lines = [
+        f"selectors={_dense(dict(section('selectors')))}",
+        f"actions[name,type,first_index,times]={_dense(section('actions'))}",
+        f"content[text,times]={_dense(section('content'))}"
+    ]
+    omitted = len(entries) - sum(len(entries_kept) for entries_kept in kept.values())
+    if omitted:
+        lines.append(f"({omitted} lower-priority entries omitted to fit the prompt)")
+    return "\n".join(lines)
@@ -0,0 +1,115 @@
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LEDGER_PATH = os.environ.get("LLM_LEDGER_PATH", "llm_ledger.jsonl")
+MAX_RECORDS_IN_MEMORY = 10000  # Older records are only kept in the JSONL file
+UNLABELLED_STAGE = "other"
+
+# USD per million (prompt, completion) tokens; unknown models are costed at 0
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4.1-mini": (0.40, 1.60)
+}
+
+# The stage and run an LLM call belongs to; contextvars follow the call into
+# asyncio tasks and asyncio.to_thread workers
+_current_stage = contextvars.ContextVar("llm_stage", default=UNLABELLED_STAGE)
+_current_run = contextvars.ContextVar("llm_run", default=None)
+
+def current_stage() -> str:
+    return _current_stage.get()
+
+@contextmanager
+def llm_stage(stage: str):
+    """Attribute every LLM call made inside the block to `stage`"""
+    token = _current_stage.set(stage)
+    try:
+        yield
+    finally:
+        _current_stage.reset(token)
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    prompt_price, completion_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+class LLMLedger:
+    """Append-only JSONL record of every LLM call: stage, tokens, latency and cost.
+
+    Calls are grouped into runs (one per user action) with run(); the
+    breakdown() of a run sums its calls per stage. Safe to share between
+    threads.
+    """
+
+    def __init__(self, path=DEFAULT_LEDGER_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._records: List[Dict[str, Any]] = []
+
+    @contextmanager
+    def run(self, label: str):
+        """Group the LLM calls made inside the block under a new run id"""
+        run_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{label}-{uuid.uuid4().hex[:6]}"
+        token = _current_run.set(run_id)
+        try:
+            yield run_id
+        finally:
+            _current_run.reset(token)
+
+    def record(self, model, prompt_tokens, completion_tokens, latency_ms, stage=None, cached=False,
+               estimated_tokens=False):
+        entry = {
+            "timestamp": time.time(),
+            "run_id": _current_run.get(),
+            "stage": stage or current_stage(),
+            "model": model,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "latency_ms": round(latency_ms, 1),
+            # Cache hits cost nothing; their tokens show what was saved
+            "cost_usd": 0.0 if cached else round(estimate_cost(model, prompt_tokens, completion_tokens), 6),
+            "cached": cached,
+            "estimated_tokens": estimated_tokens
+        }
+        with self._lock:
+            self._records.append(entry)
+            del self._records[:-MAX_RECORDS_IN_MEMORY]
+            try:
+                with open(self.path, "a", encoding="utf-8") as ledger_file:
+                    ledger_file.write(json.dumps(entry) + "\n")
+            except OSError as e:
+                logger.warning(f"Could not write LLM ledger {self.path}: {str(e)}")
+        return entry
+
+    def records(self, run_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [entry for entry in self._records if run_id is None or entry["run_id"] == run_id]
+
+    def breakdown(self, run_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Per-stage totals for a run, most expensive stage first"""
+        stages = {}
+        for entry in self.records(run_id):
+            row = stages.setdefault(entry["stage"], {
+                "Stage": entry["stage"], "Calls": 0, "Cached": 0, "Prompt Tokens": 0,
+                "Completion Tokens": 0, "Total Latency (s)": 0.0, "Cost (USD)": 0.0
+            })
+            row["Calls"] += 1
+            row["Cached"] += int(entry["cached"])
+            row["Prompt Tokens"] += entry["prompt_tokens"]
+            row["Completion Tokens"] += entry["completion_tokens"]
+            row["Total Latency (s)"] += entry["latency_ms"] / 1000
+            row["Cost (USD)"] += entry["cost_usd"]
+        for row in stages.values():
+            row["Total Latency (s)"] = round(row["Total Latency (s)"], 2)
+            row["Cost (USD)"] = round(row["Cost (USD)"], 4)
+        return sorted(stages.values(), key=lambda row: (-row["Cost (USD)"], -row["Total Latency (s)"]))
@@ -0,0 +1,146 @@
+import time
+import logging
+from typing import Dict, Any, Optional
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+# Readiness strategies a load profile can pick from
+READY_STATES = ("networkidle", "load", "domcontentloaded", "selector", "quiet_dom")
+
+# Analytics and ad hosts that never contribute to page structure
+TRACKING_HOSTS = [
+    "google-analytics.com", "googletagmanager.com", "doubleclick.net", "googlesyndication.com",
+    "facebook.net", "connect.facebook.net", "hotjar.com", "segment.io", "segment.com",
+    "mixpanel.com", "clarity.ms", "newrelic.com", "nr-data.net", "fullstory.com", "intercom.io"
+]
+
+LOAD_PROFILES = {
+    # Structure extraction only needs the DOM: skip heavy assets and trackers
+    "fast": {
+        "blocked_resource_types": ["image", "media", "font"],
+        "blocked_hosts": TRACKING_HOSTS,
+        "block_third_party": False,
+        "ready_state": "quiet_dom",
+        "ready_selector": None,
+        "quiet_dom_ms": 500,
+        "quiet_dom_max_ms": 3000,
+        "timeout_ms": 15000
+    },
+    # Fastest: also drop every third-party request and don't wait for the DOM to settle
+    "minimal": {
+        "blocked_resource_types": ["image", "media", "font", "stylesheet"],
+        "blocked_hosts": TRACKING_HOSTS,
+        "block_third_party": True,
+        "ready_state": "domcontentloaded",
+        "ready_selector": None,
+        "quiet_dom_ms": 0,
+        "quiet_dom_max_ms": 0,
+        "timeout_ms": 15000
+    },
+    # Previous behaviour: load everything and wait for the network to go idle
+    "full": {
+        "blocked_resource_types": [],
+        "blocked_hosts": [],
+        "block_third_party": False,
+        "ready_state": "networkidle",
+        "ready_selector": None,
+        "quiet_dom_ms": 0,
+        "quiet_dom_max_ms": 0,
+        "timeout_ms": 30000
+    }
+}
+
+DEFAULT_LOAD_PROFILE = "fast"
+
+# Resolves once no DOM mutation happened for quietMs (or after maxMs on pages that never settle)
+QUIET_DOM_SCRIPT = """
+([quietMs, maxMs]) => new Promise(resolve => {
+    let timer = null;
+    const root = document.documentElement || document;
+    const done = () => {
+        observer.disconnect();
+        resolve(true);
+    };
+    const observer = new MutationObserver(() => {
+        clearTimeout(timer);
+        timer = setTimeout(done, quietMs);
+    });
+    observer.observe(root, {childList: true, subtree: true, attributes: true});
+    timer = setTimeout(done, quietMs);
+    setTimeout(done, maxMs);
+})
+"""
+
+def resolve_load_profile(profile=None) -> Dict[str, Any]:
+    """Turn a profile name or partial dict into a complete load profile"""
+    if profile is None:
+        profile = DEFAULT_LOAD_PROFILE
+    if isinstance(profile, str):
+        if profile not in LOAD_PROFILES:
+            raise ValueError(f"Unknown load profile '{profile}', expected one of {list(LOAD_PROFILES)}")
+        return dict(LOAD_PROFILES[profile])
+
+    resolved = dict(LOAD_PROFILES[profile.get("base", DEFAULT_LOAD_PROFILE)])
+    resolved.update({key: value for key, value in profile.items() if key != "base"})
+    if resolved["ready_state"] not in READY_STATES:
+        raise ValueError(f"Unknown ready_state '{resolved['ready_state']}', expected one of {READY_STATES}")
+    if resolved["ready_state"] == "selector" and not resolved.get("ready_selector"):
+        raise ValueError("ready_state 'selector' needs a ready_selector")
+    return resolved
+
+def _host_matches(host: str, patterns) -> bool:
+    return any(host == pattern or host.endswith("." + pattern) for pattern in patterns)
+
+def _site_root(host: str) -> str:
+    return host[4:] if host.startswith("www.") else host
+
+async def install_resource_blocking(context, profile: Dict[str, Any], first_party_host: Optional[str] = None):
+    """Abort blocked resource types and hosts for every page in a browser context"""
+    blocked_types = set(profile.get("blocked_resource_types") or [])
+    blocked_hosts = profile.get("blocked_hosts") or []
+    block_third_party = profile.get("block_third_party") and first_party_host
+    if not blocked_types and not blocked_hosts and not block_third_party:
+        return
+
+    site_root = _site_root(first_party_host) if first_party_host else None
+
+    async def handle_route(route):
+        request = route.request
+        # Never block the page itself
+        if request.is_navigation_request():
+            await route.continue_()
+            return
+        host = (urlsplit(request.url).hostname or "").lower()
+        if (
+            request.resource_type in blocked_types
+            or _host_matches(host, blocked_hosts)
+            or (block_third_party and host and not _host_matches(host, [site_root]))
+        ):
+            await route.abort()
+        else:
+            await route.continue_()
+
+    await context.route("**/*", handle_route)
+
+async def navigate(page, url: str, profile: Dict[str, Any]):
+    """Open a URL using the profile's readiness strategy.
+
+    Returns (response, load_time_ms). Selector and quiet-DOM waits are best
+    effort: when they time out the page is extracted as it is.
+    """
+    started = time.perf_counter()
+    ready_state = profile["ready_state"]
+    wait_until = ready_state if ready_state in ("networkidle", "load", "domcontentloaded") else "domcontentloaded"
+    response = await page.goto(url, wait_until=wait_until, timeout=profile["timeout_ms"])
+
+    try:
+        if ready_state == "selector":
+            await page.wait_for_selector(profile["ready_selector"], timeout=profile["timeout_ms"])
+        elif ready_state == "quiet_dom" and profile.get("quiet_dom_ms"):
+            await page.evaluate(QUIET_DOM_SCRIPT, [profile["quiet_dom_ms"], profile.get("quiet_dom_max_ms") or profile["timeout_ms"]])
+    except Exception as e:
+        logger.warning(f"Readiness wait '{ready_state}' did not complete for {url}: {str(e)}")
+
+    load_time_ms = int((time.perf_counter() - started) * 1000)
+    return response, load_time_ms
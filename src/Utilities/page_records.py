@@ -0,0 +1,176 @@
+import sys
+from collections.abc import MutableMapping
+from typing import Dict, Any, Optional
+
+# Attributes worth keeping for prompts and selectors; everything else
+# (inline styles, tracking data-*, framework ids) is dropped when compacting
+ATTRIBUTE_ALLOWLIST = frozenset([
+    "id", "name", "type", "href", "placeholder", "value", "class", "role",
+    "aria-label", "title", "alt", "for", "action", "method",
+    "data-testid", "data-test", "data-qa", "data-cy"
+])
+MAX_ATTRIBUTE_LENGTH = 200  # Longer attribute values are truncated when compacting
+
+def _intern(value):
+    """Share one copy of repeated strings (class lists, tags, input types)"""
+    return sys.intern(value) if isinstance(value, str) else value
+
+def _compact_attributes(attributes):
+    return tuple(
+        (_intern(name), _intern(value[:MAX_ATTRIBUTE_LENGTH] if isinstance(value, str) else value))
+        for name, value in attributes.items()
+        if name in ATTRIBUTE_ALLOWLIST
+    )
+
+class ElementRecord:
+    """Slotted, interned form of an analyze_element() dict"""
+
+    __slots__ = ("tag", "attributes", "text", "href", "input_type", "name", "placeholder",
+                 "is_button", "is_submit")
+
+    # Optional keys of the dict form, in the order analyze_element adds them
+    OPTIONAL_FIELDS = ("href", "input_type", "name", "placeholder", "is_button", "is_submit")
+
+    def __init__(self, tag, attributes, text, href=None, input_type=None, name=None,
+                 placeholder=None, is_button=None, is_submit=None):
+        self.tag = tag
+        self.attributes = attributes
+        self.text = text
+        self.href = href
+        self.input_type = input_type
+        self.name = name
+        self.placeholder = placeholder
+        self.is_button = is_button
+        self.is_submit = is_submit
+
+    @classmethod
+    def from_dict(cls, element: Dict[str, Any]) -> "ElementRecord":
+        return cls(
+            _intern(element.get("tag", "")),
+            _compact_attributes(element.get("attributes", {})),
+            element.get("text", ""),
+            **{field: _intern(element[field]) for field in cls.OPTIONAL_FIELDS if field in element}
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        element = {
+            "tag": self.tag,
+            "type": self.tag,
+            "attributes": dict(self.attributes),
+            "text": self.text
+        }
+        for field in self.OPTIONAL_FIELDS:
+            value = getattr(self, field)
+            if value is not None:
+                element[field] = value
+        return element
+
+class FormRecord:
+    """Slotted form of an analyze_form() dict"""
+
+    __slots__ = ("inputs", "submit", "action", "method", "likely_purpose")
+
+    def __init__(self, inputs, submit, action, method, likely_purpose):
+        self.inputs = inputs
+        self.submit = submit
+        self.action = action
+        self.method = method
+        self.likely_purpose = likely_purpose
+
+    @classmethod
+    def from_dict(cls, form: Dict[str, Any]) -> "FormRecord":
+        return cls(
+            tuple(ElementRecord.from_dict(input_info) for input_info in form.get("inputs", [])),
+            ElementRecord.from_dict(form["submit"]) if form.get("submit") else None,
+            form.get("action", ""),
+            _intern(form.get("method", "get")),
+            _intern(form.get("likely_purpose", "form submission"))
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "inputs": [input_record.to_dict() for input_record in self.inputs],
+            "submit": self.submit.to_dict() if self.submit else None,
+            "action": self.action,
+            "method": self.method,
+            "likely_purpose": self.likely_purpose
+        }
+
+class PageRecord:
+    """Slotted form of a discovered page's page_data dict"""
+
+    __slots__ = ("title", "elements", "forms", "template", "load_time_ms", "from_cache",
+                 "fetch_mode", "extra")
+
+    def __init__(self, title, elements, forms, template=None, load_time_ms=None, from_cache=None,
+                 fetch_mode=None, extra=None):
+        self.title = title
+        self.elements = elements
+        self.forms = forms
+        self.template = template
+        self.load_time_ms = load_time_ms
+        self.from_cache = from_cache
+        self.fetch_mode = fetch_mode
+        # Any other keys, kept as-is so conversion never loses data
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, page_data: Dict[str, Any]) -> "PageRecord":
+        known = ("title", "elements", "forms", "template", "load_time_ms", "from_cache", "fetch_mode")
+        extra = {key: value for key, value in page_data.items() if key not in known}
+        return cls(
+            page_data.get("title", ""),
+            tuple(ElementRecord.from_dict(element) for element in page_data.get("elements", [])),
+            tuple(FormRecord.from_dict(form) for form in page_data.get("forms", [])),
+            _intern(page_data.get("template")),
+            page_data.get("load_time_ms"),
+            page_data.get("from_cache"),
+            _intern(page_data.get("fetch_mode")),
+            extra or None
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        page_data = {
+            "title": self.title,
+            "elements": [element.to_dict() for element in self.elements],
+            "forms": [form.to_dict() for form in self.forms]
+        }
+        for field in ("template", "load_time_ms", "from_cache", "fetch_mode"):
+            value = getattr(self, field)
+            if value is not None:
+                page_data[field] = value
+        if self.extra:
+            page_data.update(self.extra)
+        return page_data
+
+class CompactPages(MutableMapping):
+    """discovered_pages stored as PageRecords.
+
+    Behaves like the plain {url: page_data} dict, but pages are only expanded
+    to dicts when read. The dicts handed out are copies, so changes to them
+    must be written back with pages[url] = page_data.
+    """
+
+    def __init__(self, pages: Optional[Dict[str, Dict[str, Any]]] = None):
+        self._records = {}
+        if pages:
+            self.update(pages)
+
+    def __getitem__(self, url):
+        return self._records[url].to_dict()
+
+    def __setitem__(self, url, page_data):
+        self._records[_intern(url)] = page_data if isinstance(page_data, PageRecord) else PageRecord.from_dict(page_data)
+
+    def __delitem__(self, url):
+        del self._records[url]
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def __len__(self):
+        return len(self._records)
+
+    def record(self, url) -> PageRecord:
+        """The stored record itself, for callers that don't need the dict form"""
+        return self._records[url]
@@ -0,0 +1,43 @@
+import re
+import hashlib
+import json
+from typing import Dict, Any, List
+from urllib.parse import urlsplit
+
+# Path segments that are almost certainly ids rather than fixed routes
+ID_SEGMENT = re.compile(r"^(\d+|[0-9a-f]{8,}|[0-9a-f-]{36}|.*\d.*-.*|.*-.*\d.*)$", re.IGNORECASE)
+
+def _form_shape(form: Dict[str, Any]) -> List[Any]:
+    """Structure of a form without any of its values or labels"""
+    return [
+        form.get("likely_purpose", ""),
+        form.get("method", "get").lower(),
+        [input_info.get("input_type") or input_info.get("tag", "") for input_info in form.get("inputs", [])],
+        bool(form.get("submit"))
+    ]
+
+def page_fingerprint(skeleton: str, forms: List[Dict[str, Any]]) -> str:
+    """Hash of a page's tag/role skeleton and form shapes.
+
+    Pages rendered from the same template (/product/1 ... /product/500) share
+    a fingerprint even though their text, links and item counts differ.
+    """
+    shape = json.dumps([skeleton, [_form_shape(form) for form in forms]], separators=(",", ":"))
+    return hashlib.sha1(shape.encode("utf-8")).hexdigest()[:12]
+
+def url_pattern(url: str) -> str:
+    """Route-like pattern of a URL: /product/123 and /product/456 both give /product/*.
+
+    Used to guess a page's template before it has been crawled.
+    """
+    parts = urlsplit(url)
+    segments = ["*" if ID_SEGMENT.match(segment) else segment for segment in parts.path.split("/")]
+    return f"{parts.netloc}{'/'.join(segments)}"
+
+def page_template(page_data: Dict[str, Any]) -> str:
+    """Template id of a discovered page, falling back to its element/form shape"""
+    if page_data.get("template"):
+        return page_data["template"]
+    # Pages extracted without a skeleton: use the element tag sequence instead
+    skeleton = ",".join(element.get("tag", "") for element in page_data.get("elements", []))
+    return page_fingerprint(skeleton, page_data.get("forms", []))
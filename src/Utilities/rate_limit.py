@@ -0,0 +1,59 @@
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, holding at most `capacity`"""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        # Waiters queue on the lock, so tokens are handed out in arrival order
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+class HostRateLimiter:
+    """Per-host politeness: a token-bucket request rate plus a concurrency cap.
+
+    Either limit can be switched off by passing None (or 0).
+    """
+
+    def __init__(self, requests_per_second=None, burst=1, max_concurrent_per_host=None):
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.max_concurrent_per_host = max_concurrent_per_host
+        self._buckets = {}
+        self._semaphores = {}
+
+    @asynccontextmanager
+    async def limit(self, url):
+        """Hold a request slot for the URL's host for the duration of the block"""
+        host = (urlsplit(url).hostname or "").lower()
+
+        semaphore = None
+        if self.max_concurrent_per_host:
+            semaphore = self._semaphores.setdefault(host, asyncio.Semaphore(self.max_concurrent_per_host))
+            await semaphore.acquire()
+        try:
+            if self.requests_per_second:
+                bucket = self._buckets.setdefault(host, TokenBucket(self.requests_per_second, self.burst))
+                await bucket.acquire()
+            yield
+        finally:
+            if semaphore:
+                semaphore.release()
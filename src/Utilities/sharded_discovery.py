@@ -0,0 +1,300 @@
+import time
+import queue
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+from multiprocessing.managers import SyncManager
+
+from src.Utilities.url_utils import CrawlScope, DEFAULT_DENIED_QUERY_PARAMS, fetchable_url
+from src.Utilities.site_graph import SiteGraph
+from src.Utilities.sitemap import discover_sitemap_urls, ROBOTS_USER_AGENT, MAX_SITEMAP_URLS
+from src.Utilities.load_profiles import DEFAULT_LOAD_PROFILE
+from src.Utilities.page_templates import url_pattern
+from src.Utilities.website_discovery import link_priority
+
+logger = logging.getLogger(__name__)
+
+SHARD_POLL_INTERVAL = 0.5   # Seconds between checks of the shared queues
+SHARD_SHUTDOWN_GRACE = 5    # Seconds shards get to exit after a stop before being terminated
+
+class FrontierManager(SyncManager):
+    """SyncManager that can also host score-ordered queues"""
+
+FrontierManager.register("PriorityQueue", queue.PriorityQueue)
+
+def shard_of(url, shards):
+    """Stable shard index for a URL (Python's hash() differs between processes)"""
+    return int(hashlib.md5(url.encode("utf-8")).hexdigest(), 16) % shards
+
+class SharedFrontier:
+    """Crawl frontier shared by every shard process through a FrontierManager.
+
+    The visited set, the pending-page counter and the page budget live in the
+    manager and are only touched under its lock, so a URL is claimed by
+    exactly one shard. Each shard owns the queue its URLs hash to, ordered
+    by link_priority() like website_discovery.CrawlFrontier, with inbound
+    links and crawled URL patterns counted across all shards.
+    """
+
+    def __init__(self, manager, shards, max_depth, robots=None, max_pages=None):
+        self.shards = shards
+        self.max_depth = max_depth
+        self.robots = robots
+        self.max_pages = max_pages
+        self.queues = [manager.PriorityQueue() for _ in range(shards)]
+        self.visited = manager.dict()
+        self.queued = manager.dict()         # url -> (priority, depth, anchor text, sitemap recency) while waiting
+        self.inbound = manager.dict()        # url -> number of pages linking to it
+        self.fetch_urls = manager.dict()     # canonical url -> the link first found to it, which is requested
+        self.seen_patterns = manager.dict()  # URL patterns of crawled pages (values unused)
+        self.lock = manager.Lock()
+        self.sequence = manager.Value("i", 0)
+        self.pending = manager.Value("i", 0)
+        self.claimed_pages = manager.Value("i", 0)
+        self.stop = manager.Event()
+
+    def _push(self, url, depth, anchor_text, sitemap_recency=None):
+        # Called with the lock held
+        priority = link_priority(url, depth, anchor_text, self.inbound.get(url, 1),
+                                 url_pattern(url) in self.seen_patterns, sitemap_recency)
+        queued = self.queued.get(url)
+        self.queued[url] = (priority, depth, anchor_text, sitemap_recency)
+        if queued is None or queued[0] != priority:
+            self.sequence.value += 1
+            self.queues[shard_of(url, self.shards)].put((-priority, self.sequence.value, url))
+
+    def add(self, url, depth, anchor_text="", sitemap_recency=None, fetch_url=None):
+        """Queue a URL unless it is too deep or already visited (see CrawlFrontier.add)"""
+        if depth > self.max_depth:
+            return False
+        with self.lock:
+            if url in self.visited:
+                self.inbound[url] = self.inbound.get(url, 1) + 1
+                queued = self.queued.get(url)
+                if queued is not None:
+                    _, queued_depth, queued_text, queued_recency = queued
+                    # A changed score leaves the old entry stale; get() skips it
+                    self._push(url, queued_depth, queued_text or anchor_text, queued_recency)
+                return False
+            if self.robots and depth > 0 and not self.robots.can_fetch(ROBOTS_USER_AGENT, url):
+                return False
+            self.visited[url] = depth
+            self.fetch_urls[url] = fetch_url or url
+            self.pending.value += 1
+            self._push(url, depth, anchor_text, sitemap_recency)
+        return True
+
+    def seed(self, urls, depth):
+        """Queue sitemap (url, fetch url) pairs, given newest lastmod first, keeping that order as a priority term"""
+        urls = list(urls)
+        return sum(
+            self.add(url, depth, sitemap_recency=1 - rank / len(urls), fetch_url=fetch_url)
+            for rank, (url, fetch_url) in enumerate(urls)
+        )
+
+    def fetch_url(self, url):
+        """The URL to request for a queued canonical URL"""
+        return self.fetch_urls.get(url, url)
+
+    def get(self, shard_index, timeout):
+        """Best-scored URL waiting for a shard as (url, depth); raises queue.Empty after timeout"""
+        while True:
+            negative_priority, _, url = self.queues[shard_index].get(True, timeout)
+            with self.lock:
+                queued = self.queued.get(url)
+                if queued is not None and queued[0] == -negative_priority:
+                    del self.queued[url]
+                    return url, queued[1]
+
+    def mark_crawled(self, url):
+        """Record the URL's pattern so later pages of the same template rank lower"""
+        self.seen_patterns[url_pattern(url)] = True
+
+    def claim_page(self):
+        """Reserve one page of the shared max_pages budget"""
+        with self.lock:
+            if self.max_pages is not None and self.claimed_pages.value >= self.max_pages:
+                return False
+            self.claimed_pages.value += 1
+            return True
+
+    def task_done(self):
+        with self.lock:
+            self.pending.value -= 1
+
+    def finished(self):
+        return self.stop.is_set() or self.pending.value <= 0
+
+async def _shard_worker(shard_index, frontier, results, browser_pool, crawl_scope, crawl_cache, rate_limiter,
+                        static_fetcher):
+    from src.Utilities.website_discovery import crawl_subpage
+
+    while not frontier.finished():
+        try:
+            url, depth = await asyncio.to_thread(frontier.get, shard_index, SHARD_POLL_INTERVAL)
+        except queue.Empty:
+            continue
+        try:
+            if frontier.stop.is_set():
+                continue
+            if not frontier.claim_page():
+                results.put(("budget_exhausted", "max_pages"))
+                frontier.stop.set()
+                continue
+            pages, page_navigation = {}, SiteGraph()
+            child_urls = await crawl_subpage(url, pages, page_navigation, browser_pool, crawl_scope,
+                                             depth=depth, max_depth=frontier.max_depth,
+                                             crawl_cache=crawl_cache, rate_limiter=rate_limiter,
+                                             static_fetcher=static_fetcher, fetch_url=frontier.fetch_url(url))
+            frontier.mark_crawled(url)
+            # Children are claimed before this page is marked done so the
+            # pending counter can't reach zero while work is still coming
+            for child_url, (anchor_text, child_fetch_url) in child_urls.items():
+                frontier.add(child_url, depth + 1, anchor_text, fetch_url=child_fetch_url)
+            results.put(("page", url, pages[url], page_navigation.edges()))
+        except Exception as e:
+            logger.error(f"Shard {shard_index} failed on {url}: {str(e)}")
+        finally:
+            frontier.task_done()
+
+async def _run_shard_async(shard_index, frontier, results, options):
+    from src.Utilities.website_discovery import BrowserPool
+    from src.Utilities.crawl_cache import CrawlCache
+    from src.Utilities.rate_limit import HostRateLimiter
+    from src.Utilities.static_fetcher import StaticFetcher
+    from urllib.parse import urlsplit
+
+    crawl_scope = CrawlScope(options["start_url"], options["scope"],
+                             options["allowed_query_params"], options["denied_query_params"])
+    browser_pool = BrowserPool(size=options["max_concurrency"], load_profile=options["load_profile"],
+                               first_party_host=urlsplit(crawl_scope.start_url).hostname)
+    crawl_cache = CrawlCache(options["cache_dir"]) if options["use_cache"] else None
+    # Every shard talks to the same hosts, so each gets its share of the rate
+    rate = options["requests_per_second"]
+    rate_limiter = HostRateLimiter(rate / frontier.shards if rate else None,
+                                   max_concurrent_per_host=options["max_concurrent_per_host"])
+    static_fetcher = StaticFetcher() if options["fetch_mode"] == "hybrid" else None
+    try:
+        await asyncio.gather(*[
+            _shard_worker(shard_index, frontier, results, browser_pool, crawl_scope, crawl_cache, rate_limiter,
+                          static_fetcher)
+            for _ in range(options["max_concurrency"])
+        ])
+    finally:
+        await browser_pool.close()
+        if static_fetcher:
+            await static_fetcher.close()
+        if crawl_cache:
+            await crawl_cache.close()
+
+def run_shard(shard_index, frontier, results, options):
+    """Process entry point: one shard with its own Playwright browser"""
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(_run_shard_async(shard_index, frontier, results, options))
+    except Exception as e:
+        logger.error(f"Shard {shard_index} crashed: {str(e)}")
+    finally:
+        results.put(("done", shard_index))
+
+async def discover_sharded_pages(start_url, discovered_pages, navigation_map, shards, max_depth=2,
+                                 max_concurrency=4, scope="origin", allowed_query_params=None,
+                                 denied_query_params=DEFAULT_DENIED_QUERY_PARAMS, use_cache=True,
+                                 cache_dir=None, load_profile=DEFAULT_LOAD_PROFILE, use_sitemap=False,
+                                 max_sitemap_urls=MAX_SITEMAP_URLS, crawl_stats=None, max_pages=None,
+                                 max_seconds=None, max_elements=None, requests_per_second=None,
+                                 max_concurrent_per_host=None, fetch_mode="hybrid"):
+    """Sharded version of website_discovery.discover_website_pages.
+
+    The frontier is partitioned by URL hash across `shards` processes, each
+    running max_concurrency pages on its own browser. Pages and navigation
+    edges are merged here into discovered_pages and the navigation_map
+    SiteGraph and yielded as (url, page_data) as they arrive.
+    """
+    logger.info(f"Starting sharded discovery from {start_url} ({shards} processes x {max_concurrency} pages)")
+    started = time.monotonic()
+    crawl_scope = CrawlScope(start_url, scope, allowed_query_params, denied_query_params)
+    navigation_map.start_url = crawl_scope.start_url
+
+    # Playwright is not fork-safe, so shards always start from a fresh interpreter
+    context = multiprocessing.get_context("spawn")
+    manager = FrontierManager(ctx=context)
+    manager.start()
+    processes = []
+    budget_exhausted = None
+    try:
+        frontier = SharedFrontier(manager, shards, max_depth, max_pages=max_pages)
+        results = manager.Queue()
+        frontier.add(crawl_scope.start_url, 0, fetch_url=fetchable_url(start_url))
+
+        if use_sitemap:
+            seed_urls, frontier.robots = await discover_sitemap_urls(crawl_scope.start_url, crawl_scope, max_sitemap_urls)
+            seeded = frontier.seed(seed_urls, max_depth)
+            logger.info(f"Seeded shared frontier with {seeded} sitemap URLs")
+
+        options = {
+            "start_url": start_url,
+            "scope": scope,
+            "allowed_query_params": allowed_query_params,
+            "denied_query_params": denied_query_params,
+            "max_concurrency": max_concurrency,
+            "load_profile": load_profile,
+            "use_cache": use_cache,
+            "cache_dir": cache_dir,
+            "requests_per_second": requests_per_second,
+            "max_concurrent_per_host": max_concurrent_per_host,
+            "fetch_mode": fetch_mode
+        }
+        processes = [
+            context.Process(target=run_shard, args=(index, frontier, results, options), daemon=True)
+            for index in range(shards)
+        ]
+        for process in processes:
+            process.start()
+
+        running = shards
+        element_count = 0
+        while running:
+            if max_seconds is not None and time.monotonic() - started >= max_seconds and not budget_exhausted:
+                budget_exhausted = "max_seconds"
+                frontier.stop.set()
+                break
+            try:
+                message = await asyncio.to_thread(results.get, True, SHARD_POLL_INTERVAL)
+            except queue.Empty:
+                # A shard killed before it could report "done" must not hang the crawl
+                if not any(process.is_alive() for process in processes):
+                    break
+                continue
+
+            if message[0] == "done":
+                running -= 1
+            elif message[0] == "budget_exhausted":
+                budget_exhausted = budget_exhausted or message[1]
+            elif message[0] == "page":
+                _, url, page_data, page_edges = message
+                discovered_pages[url] = page_data
+                navigation_map.add_edges(page_edges)
+                element_count += len(page_data.get("elements", []))
+                if max_elements is not None and element_count >= max_elements and not budget_exhausted:
+                    budget_exhausted = "max_elements"
+                    frontier.stop.set()
+                if crawl_stats is not None:
+                    crawl_stats["pages_crawled"] = len(discovered_pages)
+                    crawl_stats["pages_pending"] = 0 if budget_exhausted else max(frontier.pending.value, 0)
+                    crawl_stats["budget_exhausted"] = budget_exhausted
+                yield url, page_data
+
+        if budget_exhausted:
+            logger.warning(f"Crawl budget exhausted ({budget_exhausted}); returning partial results")
+    finally:
+        for process in processes:
+            await asyncio.to_thread(process.join, SHARD_SHUTDOWN_GRACE)
+            if process.is_alive():
+                process.terminate()
+        manager.shutdown()
+        if crawl_stats is not None:
+            crawl_stats["pages_crawled"] = len(discovered_pages)
+            crawl_stats["pages_pending"] = 0
+            crawl_stats["budget_exhausted"] = budget_exhausted
@@ -0,0 +1,131 @@
+from collections import deque
+from collections.abc import Mapping
+from typing import Dict, List, Optional, Tuple
+
+class SiteGraph(Mapping):
+    """Every link discovered during a crawl, with forward and reverse adjacency.
+
+    Edges are (source, target, via) where via is the link text. Several links
+    between the same pair of pages are kept as separate via texts.
+
+    For code written against the old navigation_map, the graph is also a
+    read-only mapping of target URL -> {"from", "via"} giving the first link
+    found to each page.
+    """
+
+    def __init__(self, start_url: Optional[str] = None):
+        self.start_url = start_url
+        self._forward: Dict[str, Dict[str, List[str]]] = {}
+        self._reverse: Dict[str, Dict[str, List[str]]] = {}
+        self._first_inbound: Dict[str, Dict[str, str]] = {}
+        self._edge_count = 0
+        self._parents = None  # BFS tree from start_url, rebuilt after new edges
+
+    def add_edge(self, source: str, target: str, via: str = "") -> bool:
+        """Record a link; returns False if this exact link was already known"""
+        vias = self._forward.setdefault(source, {}).setdefault(target, [])
+        if via in vias:
+            return False
+        vias.append(via)
+        self._reverse.setdefault(target, {}).setdefault(source, []).append(via)
+        self._first_inbound.setdefault(target, {"from": source, "via": via})
+        self._edge_count += 1
+        self._parents = None
+        return True
+
+    def add_edges(self, edges) -> None:
+        for source, target, via in edges:
+            self.add_edge(source, target, via)
+
+    def edges(self) -> List[Tuple[str, str, str]]:
+        return [
+            (source, target, via)
+            for source, targets in self._forward.items()
+            for target, vias in targets.items()
+            for via in vias
+        ]
+
+    @property
+    def edge_count(self) -> int:
+        return self._edge_count
+
+    def outgoing(self, url: str) -> List[Tuple[str, str]]:
+        """(target, via) for every link on the page, in O(out-degree)"""
+        return [(target, via) for target, vias in self._forward.get(url, {}).items() for via in vias]
+
+    def incoming(self, url: str) -> List[Tuple[str, str]]:
+        """(source, via) for every link to the page, in O(in-degree)"""
+        return [(source, via) for source, vias in self._reverse.get(url, {}).items() for via in vias]
+
+    def neighborhood(self, url: str) -> Dict[str, Dict[str, str]]:
+        """The page's outgoing links plus how it is reached, in the old navigation_map shape"""
+        neighborhood = {target: {"from": url, "via": vias[0]} for target, vias in self._forward.get(url, {}).items()}
+        if url in self._first_inbound:
+            neighborhood[url] = self._first_inbound[url]
+        return neighborhood
+
+    def _bfs_parents(self) -> Dict[str, Tuple[str, str]]:
+        if self._parents is None:
+            parents = {}
+            if self.start_url is not None:
+                queue = deque([self.start_url])
+                seen = {self.start_url}
+                while queue:
+                    source = queue.popleft()
+                    for target, vias in self._forward.get(source, {}).items():
+                        if target not in seen:
+                            seen.add(target)
+                            parents[target] = (source, vias[0])
+                            queue.append(target)
+            self._parents = parents
+        return self._parents
+
+    def shortest_path(self, url: str) -> Optional[List[Tuple[str, str, str]]]:
+        """Fewest-clicks path from start_url as (source, target, via) edges.
+
+        Returns [] for the start page itself and None if it can't be reached.
+        """
+        if url == self.start_url:
+            return []
+        parents = self._bfs_parents()
+        if url not in parents:
+            return None
+        path = []
+        while url != self.start_url:
+            source, via = parents[url]
+            path.append((source, url, via))
+            url = source
+        return list(reversed(path))
+
+    def navigation_step(self, url: str) -> Optional[str]:
+        """Gherkin step that reaches the page by clicking through from the start page"""
+        path = self.shortest_path(url)
+        if not path:
+            return None
+        clicks = " > ".join(f'"{via.strip() or target}"' for _, target, via in path)
+        return f'Given I navigate via {clicks} from "{self.start_url}"'
+
+    def subgraph(self, *urls: str) -> "SiteGraph":
+        """Copy holding the pages' neighborhoods and shortest paths from start_url.
+
+        Small enough to hand to another thread while the crawl keeps adding
+        edges to this graph.
+        """
+        graph = SiteGraph(self.start_url)
+        # First inbound links go in first so the copy maps each page the same way
+        for url in urls:
+            if url in self._first_inbound:
+                graph.add_edge(self._first_inbound[url]["from"], url, self._first_inbound[url]["via"])
+        for url in urls:
+            graph.add_edges(self.shortest_path(url) or [])
+            graph.add_edges((url, target, via) for target, via in self.outgoing(url))
+        return graph
+
+    def __getitem__(self, url):
+        return self._first_inbound[url]
+
+    def __iter__(self):
+        return iter(self._first_inbound)
+
+    def __len__(self):
+        return len(self._first_inbound)
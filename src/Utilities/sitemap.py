@@ -0,0 +1,107 @@
+import gzip
+import logging
+from typing import List, Tuple, Optional
+from urllib.parse import urljoin
+from urllib.robotparser import RobotFileParser
+import xml.etree.ElementTree as ET
+
+import aiohttp
+
+from src.Utilities.url_utils import fetchable_url
+
+logger = logging.getLogger(__name__)
+
+ROBOTS_USER_AGENT = "GenAIWebTesting"
+MAX_SITEMAP_URLS = 500      # Cap on page URLs taken from sitemaps
+MAX_SITEMAP_FILES = 20      # Cap on sitemap documents fetched (indexes included)
+SITEMAP_TIMEOUT = 15        # Seconds per robots.txt/sitemap request
+
+async def _fetch(session, url) -> Optional[bytes]:
+    try:
+        async with session.get(url) as response:
+            if response.status != 200:
+                logger.info(f"Skipping {url}: HTTP {response.status}")
+                return None
+            return await response.read()
+    except Exception as e:
+        logger.warning(f"Could not fetch {url}: {str(e)}")
+        return None
+
+async def fetch_robots(session, start_url) -> RobotFileParser:
+    """Fetch and parse robots.txt; a missing file allows everything"""
+    robots_url = urljoin(start_url, "/robots.txt")
+    robots = RobotFileParser(robots_url)
+    body = await _fetch(session, robots_url)
+    robots.parse(body.decode("utf-8", errors="replace").splitlines() if body else [])
+    return robots
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+def parse_sitemap(body: bytes) -> Tuple[List[str], List[Tuple[str, str]]]:
+    """Parse a (possibly gzipped) sitemap.
+
+    Returns (nested sitemap URLs, [(page URL, lastmod)]); a sitemap index only
+    yields the former, a urlset only the latter.
+    """
+    if body[:2] == b"\x1f\x8b":
+        body = gzip.decompress(body)
+    root = ET.fromstring(body)
+
+    nested, pages = [], []
+    for entry in root:
+        fields = {_local_name(child.tag): (child.text or "").strip() for child in entry}
+        loc = fields.get("loc")
+        if not loc:
+            continue
+        if _local_name(entry.tag) == "sitemap":
+            nested.append(loc)
+        elif _local_name(entry.tag) == "url":
+            pages.append((loc, fields.get("lastmod", "")))
+    return nested, pages
+
+async def discover_sitemap_urls(start_url, crawl_scope, max_urls=MAX_SITEMAP_URLS):
+    """Collect in-scope page URLs from robots.txt and the site's sitemaps.
+
+    Returns (urls, robots) where urls are (canonical url, url to fetch)
+    pairs, allowed by robots.txt and ordered most recently modified first,
+    and robots is the parsed RobotFileParser the crawl should keep honoring.
+    """
+    timeout = aiohttp.ClientTimeout(total=SITEMAP_TIMEOUT)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        robots = await fetch_robots(session, start_url)
+
+        pending = list(robots.site_maps() or []) or [urljoin(start_url, "/sitemap.xml")]
+        fetched = set()
+        entries = {}
+        locations = {}
+        while pending and len(fetched) < MAX_SITEMAP_FILES and len(entries) < max_urls:
+            sitemap_url = pending.pop(0)
+            if sitemap_url in fetched:
+                continue
+            fetched.add(sitemap_url)
+
+            body = await _fetch(session, sitemap_url)
+            if not body:
+                continue
+            try:
+                nested, pages = parse_sitemap(body)
+            except (ET.ParseError, OSError) as e:
+                logger.warning(f"Could not parse sitemap {sitemap_url}: {str(e)}")
+                continue
+
+            pending.extend(nested)
+            for loc, lastmod in pages:
+                url = crawl_scope.resolve(loc, sitemap_url)
+                if not url or not robots.can_fetch(ROBOTS_USER_AGENT, url):
+                    continue
+                # Keep the newest lastmod, and the first location, if a URL is listed twice
+                entries[url] = max(lastmod, entries.get(url, ""))
+                locations.setdefault(url, fetchable_url(loc, sitemap_url))
+                if len(entries) >= max_urls:
+                    break
+
+    # ISO 8601 dates sort lexically; pages without lastmod go last
+    urls = sorted(entries, key=lambda url: entries[url], reverse=True)
+    logger.info(f"Found {len(urls)} in-scope URLs in {len(fetched)} sitemap(s)")
+    return [(url, locations[url]) for url in urls], robots
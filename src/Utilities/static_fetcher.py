@@ -0,0 +1,231 @@
+import re
+import time
+import logging
+from typing import Dict, Any, Optional
+from urllib.parse import urljoin
+
+import aiohttp
+from bs4 import BeautifulSoup, Comment
+
+logger = logging.getLogger(__name__)
+
+STATIC_FETCH_TIMEOUT = 15         # Seconds per static HTML request
+STATIC_MAX_CONNECTIONS = 16       # Pooled connections shared by all crawl workers
+MIN_STATIC_TEXT_LENGTH = 200      # Less visible text than this suggests client-side rendering
+SPA_ROOT_IDS = ("root", "app", "__next", "__nuxt", "svelte", "main-app")
+SPA_ROOT_ATTRIBUTES = ("ng-app", "ng-version", "data-reactroot", "data-server-rendered", "data-v-app")
+NOSCRIPT_HINT = re.compile(r"(enable|requires?|turn on)\s+javascript", re.IGNORECASE)
+IGNORED_SKELETON_TAGS = ("script", "style", "noscript", "template", "link", "meta")
+NON_TEXT_TAGS = ("script", "style", "noscript", "template")  # Never rendered as page text
+
+# Ranking used to pick which elements get detailed analysis, shared with the
+# in-page EXTRACTION_SCRIPT so both fetch paths select the same elements
+ELEMENT_RANK_WEIGHTS = {
+    "visible": 12,       # Rendered and not hidden; outweighs every other signal
+    "mainContent": 4,    # Inside <main>, <article> or a content container
+    "pageChrome": -2,    # Inside header/nav/footer/aside
+    "inForm": 3,         # Part of a form
+    "control": 2         # Buttons and inputs rather than plain links
+}
+MAIN_CONTENT_SELECTOR = "main, [role='main'], article, #content, #main, .content, .main-content"
+PAGE_CHROME_SELECTOR = "header, nav, footer, aside, [role='banner'], [role='navigation'], [role='contentinfo']"
+HIDDEN_STYLE = re.compile(r"(display\s*:\s*none|visibility\s*:\s*hidden)", re.IGNORECASE)
+
+def _attributes_of(el) -> Dict[str, str]:
+    # BeautifulSoup splits multi-valued attributes (class, rel, ...) into lists
+    return {
+        name: " ".join(value) if isinstance(value, list) else value
+        for name, value in el.attrs.items()
+    }
+
+def _text_of(el, max_text) -> str:
+    return el.get_text().strip()[:max_text]
+
+def _describe(el, max_text) -> Dict[str, Any]:
+    return {"tag": el.name, "attributes": _attributes_of(el), "text": _text_of(el, max_text)}
+
+def _is_hidden(el) -> bool:
+    # Without layout, only markup-level hiding can be detected
+    if el.get("type") == "hidden":
+        return True
+    for node in [el] + list(el.parents):
+        if node.name is None or node.name == "[document]":
+            break
+        if node.has_attr("hidden") or node.get("aria-hidden") == "true" or HIDDEN_STYLE.search(node.get("style", "")):
+            return True
+    return False
+
+def _rank_of(el, main_content, page_chrome) -> int:
+    """Static counterpart of rankOf() in EXTRACTION_SCRIPT"""
+    rank = 0
+    if not _is_hidden(el):
+        rank += ELEMENT_RANK_WEIGHTS["visible"]
+    if id(el) in main_content:
+        rank += ELEMENT_RANK_WEIGHTS["mainContent"]
+    elif id(el) in page_chrome:
+        rank += ELEMENT_RANK_WEIGHTS["pageChrome"]
+    if el.find_parent("form") is not None:
+        rank += ELEMENT_RANK_WEIGHTS["inForm"]
+    if el.name != "a":
+        rank += ELEMENT_RANK_WEIGHTS["control"]
+    return rank
+
+def _descendants_of(soup, selector):
+    """ids of every element inside a container matching the selector"""
+    inside = set()
+    for container in soup.select(selector):
+        inside.update(id(el) for el in container.find_all(True))
+    return inside
+
+def _skeleton_of(el, depth, max_depth) -> str:
+    role = el.get("role")
+    name = el.name + (f"[{role}]" if role else "")
+    if depth >= max_depth:
+        return name
+    parts = []
+    for child in el.find_all(recursive=False):
+        if child.name in IGNORED_SKELETON_TAGS:
+            continue
+        part = _skeleton_of(child, depth + 1, max_depth)
+        # Collapse repeated siblings so item counts don't change the skeleton
+        if not parts or parts[-1] != part:
+            parts.append(part)
+    return f"{name}({','.join(parts)})" if parts else name
+
+def _visible_text(el, separator=" ") -> str:
+    """el.get_text(separator, strip=True) without script, style and noscript text.
+
+    Reads the tree without changing it, so the same soup can be extracted afterwards.
+    """
+    return separator.join(
+        text.strip() for text in el.find_all(string=True)
+        if text.strip() and not isinstance(text, Comment)
+        and not any(parent.name in NON_TEXT_TAGS for parent in text.parents)
+    )
+
+def looks_js_rendered(soup) -> Optional[str]:
+    """Return why a page seems to need JavaScript to render, or None if it doesn't.
+
+    Doesn't modify the soup.
+    """
+    body = soup.body
+    if body is None:
+        return "no body"
+
+    for noscript in body.find_all("noscript"):
+        if NOSCRIPT_HINT.search(noscript.get_text()):
+            return "noscript hint"
+
+    # Visible text without scripts, styles and noscript fallbacks
+    text_length = len(_visible_text(body))
+
+    for root_id in SPA_ROOT_IDS:
+        root = body.find(id=root_id)
+        if root is not None and len(_visible_text(root, "")) < MIN_STATIC_TEXT_LENGTH:
+            return f"empty SPA root #{root_id}"
+    for attribute in SPA_ROOT_ATTRIBUTES:
+        if body.find(attrs={attribute: True}) is not None and text_length < MIN_STATIC_TEXT_LENGTH:
+            return f"SPA marker {attribute}"
+
+    if text_length < MIN_STATIC_TEXT_LENGTH and not body.find(["a", "form", "button", "input"]):
+        return "empty body"
+    return None
+
+def html_looks_js_rendered(html) -> Optional[str]:
+    """looks_js_rendered for raw HTML, e.g. the response to a browser navigation"""
+    return looks_js_rendered(BeautifulSoup(html, "html.parser"))
+
+def extract_static_structure(html, url, max_elements, max_forms, max_form_inputs, max_text, max_skeleton_depth):
+    """Build the same payload as website_discovery.EXTRACTION_SCRIPT from raw HTML.
+
+    url is the page's real (final) URL. Links and form actions come back
+    absolute, resolved against it and any <base href>, like a.href and
+    form.action in the browser. Returns None when the page looks
+    JS-rendered and needs a real browser.
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    reason = looks_js_rendered(soup)
+    if reason:
+        logger.info(f"{url} looks JS-rendered ({reason}), escalating to the browser")
+        return None
+
+    base = soup.find("base", href=True)
+    base_url = urljoin(url, base["href"]) if base is not None else url
+
+    interactive = soup.find_all(["a", "button", "input", "select", "textarea"])
+    main_content = _descendants_of(soup, MAIN_CONTENT_SELECTOR)
+    page_chrome = _descendants_of(soup, PAGE_CHROME_SELECTOR)
+    # sorted() is stable, so equally ranked elements keep their DOM order
+    ranked = sorted(interactive, key=lambda el: -_rank_of(el, main_content, page_chrome))
+    elements = [_describe(el, max_text) for el in ranked[:max_elements]]
+
+    forms = []
+    for form in soup.find_all("form")[:max_forms]:
+        method = (form.get("method") or "get").lower()
+        forms.append({
+            # Match the DOM: form.action is absolute and defaults to the page URL
+            "action": urljoin(base_url, form.get("action") or ""),
+            "method": method if method in ("get", "post", "dialog") else "get",
+            "text": form.get_text()[:max_text],
+            "inputs": [_describe(el, max_text) for el in form.find_all(["input", "select", "textarea"])[:max_form_inputs]],
+            "buttons": [_describe(el, max_text) for el in form.find_all("button")[:max_form_inputs]]
+        })
+
+    # Every anchor feeds the crawl frontier, not just the analyzed elements
+    links = []
+    seen_hrefs = set()
+    for a in soup.find_all("a", href=True):
+        href = urljoin(base_url, a["href"].strip())
+        if href not in seen_hrefs:
+            seen_hrefs.add(href)
+            links.append({"href": href, "text": _text_of(a, max_text)})
+
+    title = soup.title.get_text().strip() if soup.title else ""
+    return {
+        "title": title,
+        "total_elements": len(interactive),
+        "total_links": len(links),
+        "elements": elements,
+        "forms": forms,
+        "links": links,
+        "skeleton": _skeleton_of(soup.body, 0, max_skeleton_depth) if soup.body else ""
+    }
+
+class StaticFetcher:
+    """Pooled aiohttp session for fetching server-rendered HTML without a browser"""
+
+    def __init__(self, max_connections=STATIC_MAX_CONNECTIONS, timeout=STATIC_FETCH_TIMEOUT):
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._session = None
+
+    def _get_session(self):
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        return self._session
+
+    async def fetch(self, url):
+        """GET a page and return (body, headers, load_time_ms, final_url), or None if it isn't HTML"""
+        started = time.perf_counter()
+        try:
+            async with self._get_session().get(url) as response:
+                content_type = response.headers.get("Content-Type", "")
+                if response.status != 200 or "html" not in content_type:
+                    logger.info(f"Static fetch of {url} returned {response.status} {content_type}, escalating")
+                    return None
+                body = await response.read()
+                headers = {name.lower(): value for name, value in response.headers.items()}
+                # Links on the page are relative to where redirects ended up
+                final_url = str(response.url)
+        except Exception as e:
+            logger.info(f"Static fetch of {url} failed ({str(e)}), escalating")
+            return None
+        return body, headers, int((time.perf_counter() - started) * 1000), final_url
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
@@ -0,0 +1,108 @@
+import re
+from typing import Dict, Any, List, Optional
+
+from pydantic import BaseModel, Field
+
+from src.Utilities.history_compactor import HISTORY_TOKEN_BUDGET, compact_history, extract_selectors_from_history
+
+DEFAULT_BASE_URL = "https://example.com"
+SCENARIO_KEYWORDS = ("Scenario:", "Scenario Outline:", "Scenario Template:")
+
+# Recorded browser-agent action -> framework-neutral step kind
+ACTION_KINDS = {
+    "go_to_url": "navigate",
+    "open_tab": "navigate",
+    "go_back": "back",
+    "input_text": "fill",
+    "click_element": "click",
+    "get_xpath_of_element": "locate",
+    "get_element_property": "read",
+    "extract_content": "read",
+    "scroll_down": "scroll",
+    "scroll_up": "scroll",
+    "send_keys": "press",
+    "wait": "wait",
+    "done": "done"
+}
+ELEMENT_ACTION_KINDS = {"click": "click", "hover": "hover", "fill": "fill"}
+
+class TestStep(BaseModel):
+    """One recorded action, independent of any test framework"""
+    scenario: int = 0
+    action: str
+    kind: str = Field(description="navigate, fill, click, hover, press, read, locate, scroll, wait, back, done or other")
+    xpath: Optional[str] = None
+    value: Optional[str] = Field(default=None, description="URL to open, text to type, keys to press or seconds to wait")
+
+class TestIR(BaseModel):
+    """Everything the code generators need, derived once from an execution history"""
+    feature_name: str
+    base_url: str
+    gherkin: str
+    selectors: Dict[str, str]
+    steps: List[TestStep]
+    execution_history: str = Field(description="compact_history() of the run, for LLM prompts")
+
+def split_scenarios(gherkin: str) -> List[str]:
+    """The text of each scenario, in order, starting with its Scenario line.
+
+    execute_test() runs scenarios in this order and tags recorded actions
+    with their position, so every consumer of those tags must split with
+    this function. Outlines count as one scenario each.
+    """
+    scenarios = []
+    current_scenario = []
+    for line in gherkin.split('\n'):
+        if line.strip().startswith(SCENARIO_KEYWORDS):
+            if current_scenario:
+                scenarios.append('\n'.join(current_scenario))
+            current_scenario = [line]
+        elif current_scenario:
+            current_scenario.append(line)
+    if current_scenario:
+        scenarios.append('\n'.join(current_scenario))
+    return scenarios
+
+def feature_name_of(gherkin_steps: str) -> str:
+    feature_match = re.search(r"Feature:\s*(.+?)(?:\n|$)", gherkin_steps)
+    if feature_match:
+        return feature_match.group(1).strip().replace(" ", "_")
+    return "Automated_Test"
+
+def _step_of(action: Dict[str, Any], element_xpaths: Dict[Any, str]) -> TestStep:
+    params = action.get("params") or {}
+    details = action.get("element_details") or {}
+    name = action.get("name", "unknown")
+    kind = ACTION_KINDS.get(name, "other")
+    if name == "perform_element_action":
+        kind = ELEMENT_ACTION_KINDS.get(params.get("action", "click"), "other")
+    xpath = details.get("xpath")
+    index = details.get("index", params.get("index"))
+    if xpath is None and index is not None:
+        # element_xpaths keys are ints in session_state but strings once serialized
+        xpath = element_xpaths.get(index, element_xpaths.get(str(index)))
+    value = next((params[key] for key in ("url", "text", "value", "keys", "seconds") if params.get(key) is not None), None)
+    return TestStep(
+        scenario=action.get("scenario", 0),
+        action=name,
+        kind=kind,
+        xpath=xpath,
+        value=str(value) if value is not None else None
+    )
+
+def build_test_ir(gherkin_steps: str, history_data: Dict[str, Any], history_token_budget: int = HISTORY_TOKEN_BUDGET) -> TestIR:
+    """Derive selectors, steps and the compact prompt history from an execution once.
+
+    Steps come from the recorded detailed_actions; XPaths missing from an
+    action are looked up in element_xpaths by element index.
+    """
+    urls = history_data.get('urls', [])
+    element_xpaths = history_data.get('element_xpaths', {}) or {}
+    return TestIR(
+        feature_name=feature_name_of(gherkin_steps),
+        base_url=urls[0] if urls else DEFAULT_BASE_URL,
+        gherkin=gherkin_steps,
+        selectors=extract_selectors_from_history(history_data),
+        steps=[_step_of(action, element_xpaths) for action in history_data.get('detailed_actions', [])],
+        execution_history=compact_history(history_data, history_token_budget)
+    )
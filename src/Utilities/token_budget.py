@@ -0,0 +1,72 @@
+import math
+import logging
+
+logger = logging.getLogger(__name__)
+
+CHARS_PER_TOKEN = 4  # Rough average for English text and JSON with the GPT-4 family tokenizers
+# Without reported usage, a response estimated at this share of max_tokens is treated as cut off
+ESTIMATED_LIMIT_FRACTION = 0.9
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+except Exception:
+    # tiktoken is optional; the character estimate is close enough for packing
+    _encoding = None
+
+def estimate_tokens(text: str) -> int:
+    """Local token count of a prompt fragment, without calling the model API"""
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+def reported_tokens(response, key_names):
+    """Token count from an agno response's metrics (a dict of lists or an object), or None"""
+    metrics = getattr(response, "metrics", None)
+    for key in key_names:
+        value = metrics.get(key) if isinstance(metrics, dict) else getattr(metrics, key, None)
+        if isinstance(value, list):
+            value = sum(value)
+        if value:
+            return int(value)
+    return None
+
+def hit_token_limit(response, max_tokens) -> bool:
+    """Whether a response was probably cut off by the model's max_tokens.
+
+    Uses the reported completion tokens when there are any, otherwise a
+    local estimate of the content (e.g. for responses replayed from cache).
+    """
+    if not max_tokens:
+        return False
+    completion_tokens = reported_tokens(response, ("output_tokens", "completion_tokens"))
+    if completion_tokens is not None:
+        return completion_tokens >= max_tokens
+    content = getattr(response, "content", None)
+    return isinstance(content, str) and estimate_tokens(content) >= max_tokens * ESTIMATED_LIMIT_FRACTION
+
+def pack_by_token_budget(items, tokens_of, token_budget, max_items=None, output_tokens_of=None, output_budget=None):
+    """Group items, in order, into batches of at most token_budget tokens.
+
+    Items are packed greedily and never reordered or split. An item that is
+    over the budget on its own gets a batch to itself. max_items caps the
+    batch length whatever the token count. With output_tokens_of and
+    output_budget, the expected response size of a batch is capped as well.
+    """
+    batches = []
+    batch, batch_tokens, batch_output = [], 0, 0
+    for item in items:
+        tokens = tokens_of(item)
+        output = output_tokens_of(item) if output_tokens_of else 0
+        if batch and (batch_tokens + tokens > token_budget or (max_items and len(batch) >= max_items)
+                      or (output_budget and batch_output + output > output_budget)):
+            batches.append(batch)
+            batch, batch_tokens, batch_output = [], 0, 0
+        batch.append(item)
+        batch_tokens += tokens
+        batch_output += output
+    if batch:
+        batches.append(batch)
+    return batches
@@ -0,0 +1,145 @@
+from fnmatch import fnmatch
+from typing import Iterable, Optional
+from urllib.parse import urljoin, urldefrag, urlsplit, urlunsplit, parse_qsl, urlencode
+
+# Tracking/session parameters that never change page structure. Short generic
+# names like ref and sid are left out: sites also use them to select content
+DEFAULT_DENIED_QUERY_PARAMS = (
+    "utm_*", "gclid", "fbclid", "msclkid", "dclid", "yclid", "mc_cid", "mc_eid",
+    "_ga", "_gl", "ref_src", "sessionid", "phpsessid", "jsessionid"
+)
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+CRAWLABLE_SCHEMES = ("http", "https")
+SCOPES = ("origin", "host", "domain")
+
+def _remove_dot_segments(path: str) -> str:
+    """Resolve '.' and '..' path segments (RFC 3986 section 5.2.4)"""
+    output = []
+    for segment in path.split("/"):
+        if segment == "..":
+            if len(output) > 1:
+                output.pop()
+        elif segment != ".":
+            output.append(segment)
+    resolved = "/".join(output)
+    # Keep the trailing slash of 'dir/.' and 'dir/..'
+    if path.endswith(("/.", "/..")):
+        resolved += "/"
+    return resolved if resolved.startswith("/") else "/" + resolved
+
+def _keep_param(name: str, allowed_params: Optional[Iterable[str]], denied_params: Iterable[str]) -> bool:
+    lowered = name.lower()
+    if allowed_params is not None:
+        return any(fnmatch(lowered, pattern.lower()) for pattern in allowed_params)
+    return not any(fnmatch(lowered, pattern.lower()) for pattern in denied_params)
+
+def canonicalize_url(href: str, base_url: Optional[str] = None,
+                     allowed_params: Optional[Iterable[str]] = None,
+                     denied_params: Iterable[str] = DEFAULT_DENIED_QUERY_PARAMS) -> Optional[str]:
+    """Resolve a link against its page and normalize it so duplicates compare equal.
+
+    Returns None for links the crawler can't follow (mailto:, javascript:, ...).
+    When allowed_params is given only those query parameters are kept,
+    otherwise everything except denied_params is kept. Both accept glob patterns.
+    """
+    if not href:
+        return None
+    href = href.strip()
+    absolute = urljoin(base_url, href) if base_url else href
+
+    parts = urlsplit(absolute)
+    scheme = parts.scheme.lower()
+    if scheme not in CRAWLABLE_SCHEMES or not parts.hostname:
+        return None
+
+    # Lowercase host, drop the default port and any trailing dot
+    host = parts.hostname.rstrip(".")
+    try:
+        port = parts.port
+    except ValueError:
+        return None
+    netloc = host
+    if port and port != DEFAULT_PORTS[scheme]:
+        netloc = f"{host}:{port}"
+    if parts.username:
+        credentials = parts.username + (f":{parts.password}" if parts.password else "")
+        netloc = f"{credentials}@{netloc}"
+
+    # '/docs/' and '/docs' are the same page; the root always keeps its slash
+    path = _remove_dot_segments(parts.path or "/")
+    if len(path) > 1:
+        path = path.rstrip("/") or "/"
+
+    # Filter and sort query parameters so their order doesn't matter
+    params = [
+        (name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if _keep_param(name, allowed_params, denied_params)
+    ]
+    query = urlencode(sorted(params))
+
+    # Fragments never reach the server
+    return urlunsplit((scheme, netloc, path, query, ""))
+
+def fetchable_url(href: str, base_url: Optional[str] = None) -> str:
+    """A link as it should be requested: resolved, with only the fragment removed.
+
+    canonicalize_url() is for telling pages apart; its trailing-slash,
+    parameter-order and parameter-filtering changes can alter what a
+    server returns, so they are not applied to the URL that is fetched.
+    """
+    href = href.strip()
+    absolute = urljoin(base_url, href) if base_url else href
+    return urldefrag(absolute)[0]
+
+def _registrable_host(host: str) -> str:
+    return host[4:] if host.startswith("www.") else host
+
+def is_same_scope(url: str, start_url: str, scope: str = "origin") -> bool:
+    """Check whether a canonical URL belongs to the site being crawled.
+
+    origin: same scheme, host and port as the start URL
+    host:   same host, any scheme or port
+    domain: same host or one of its subdomains (www. is ignored)
+    """
+    if scope not in SCOPES:
+        raise ValueError(f"Unknown crawl scope '{scope}', expected one of {SCOPES}")
+    target, start = urlsplit(url), urlsplit(start_url)
+    if not target.hostname or not start.hostname:
+        return False
+
+    if scope == "origin":
+        return (
+            target.scheme == start.scheme
+            and target.hostname == start.hostname
+            and (target.port or DEFAULT_PORTS.get(target.scheme)) == (start.port or DEFAULT_PORTS.get(start.scheme))
+        )
+    if scope == "host":
+        return target.hostname == start.hostname
+
+    root = _registrable_host(start.hostname)
+    host = _registrable_host(target.hostname)
+    return host == root or host.endswith("." + root)
+
+class CrawlScope:
+    """Canonicalization rules plus the same-site policy for one discovery run"""
+
+    def __init__(self, start_url, scope="origin", allowed_params=None,
+                 denied_params=DEFAULT_DENIED_QUERY_PARAMS):
+        self.scope = scope
+        self.allowed_params = allowed_params
+        self.denied_params = denied_params
+        self.start_url = self.canonicalize(start_url) or start_url
+
+    def canonicalize(self, href, base_url=None):
+        return canonicalize_url(href, base_url, self.allowed_params, self.denied_params)
+
+    def contains(self, url):
+        return is_same_scope(url, self.start_url, self.scope)
+
+    def resolve(self, href, base_url):
+        """Canonicalize a link and return it only if it stays inside the crawl scope"""
+        canonical = self.canonicalize(href, base_url)
+        if canonical and self.contains(canonical):
+            return canonical
+        return None
@@ -1,9 +1,12 @@
 from browser_use import Browser, Agent as BrowserAgent, Controller, ActionResult
+from langchain_core.callbacks import BaseCallbackHandler
 
-import re
+import time
 
 from pydantic import BaseModel
-from typing import Dict, Any, Optional, List
+from typing import Optional
+
+from src.Utilities.token_budget import estimate_tokens
 
 # Set up custom controller actions
 controller = Controller()
@@ -114,48 +117,67 @@ async def perform_element_action(params: ElementAction, browser: Browser):
     except Exception as e:
         return ActionResult(error=f"Error performing action: {str(e)}")
 
-# Helper functions for code generation
-def extract_selectors_from_history(history_data: Dict[str, Any]) -> Dict[str, str]:
-    """Extract element selectors from agent history"""
-    selectors = {}
-    xpath_pattern = re.compile(r"The xpath of the element is (.*)")
-    
-    for content in history_data.get('extracted_content', []):
-        if isinstance(content, str):
-            match = xpath_pattern.search(content)
-            if match:
-                xpath = match.group(1)
-                # Create a meaningful name based on surrounding context
-                name = "element_" + str(len(selectors) + 1)
-                selectors[name] = xpath
-    
-    return selectors
+def _message_text(content) -> str:
+    """Text of a chat message's content, which may be a list of text/image parts"""
+    if isinstance(content, str):
+        return content
+    return "\n".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content or [])
 
-def analyze_actions(history_data: Dict[str, Any]) -> List[Dict[str, Any]]:
-    """Analyze the actions performed by the agent to create step implementations"""
-    actions = []
-    
-    for i, action_name in enumerate(history_data.get('action_names', [])):
-        action_info = {
-            "name": action_name,
-            "index": i,
-            "type": "unknown"
-        }
-        
-        # Determine action type
-        if "navigate" in action_name.lower() or "goto" in action_name.lower():
-            action_info["type"] = "navigation"
-        elif "click" in action_name.lower():
-            action_info["type"] = "click"
-        elif "type" in action_name.lower() or "fill" in action_name.lower() or "enter" in action_name.lower():
-            action_info["type"] = "input"
-        elif "check" in action_name.lower() or "verify" in action_name.lower() or "assert" in action_name.lower():
-            action_info["type"] = "verification"
-        elif "get xpath" in action_name.lower():
-            action_info["type"] = "xpath"
-        elif "save job details" in action_name.lower():
-            action_info["type"] = "custom_save"
-        
-        actions.append(action_info)
-    
-    return actions
+class LedgerCallbackHandler(BaseCallbackHandler):
+    """Records each LangChain model call (e.g. browser-agent steps) in an LLMLedger.
+
+    When the provider reports no usage, tokens are estimated from the prompt
+    and generated text and the record is flagged as estimated.
+    """
+
+    def __init__(self, ledger, stage, model="unknown"):
+        self.ledger = ledger
+        self.stage = stage
+        self.model = model
+        self._started = {}
+        self._prompts = {}
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+        self._prompts[run_id] = "\n".join(prompts)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+        self._prompts[run_id] = "\n".join(
+            _message_text(message.content) for batch in messages for message in batch
+        )
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        started = self._started.pop(run_id, time.perf_counter())
+        prompt = self._prompts.pop(run_id, "")
+        llm_output = response.llm_output or {}
+        usage = llm_output.get("token_usage") or {}
+        prompt_tokens, completion_tokens = usage.get("prompt_tokens"), usage.get("completion_tokens")
+        if prompt_tokens is None:
+            # Newer providers report usage on the message instead
+            for generations in response.generations:
+                for generation in generations:
+                    metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                    if metadata.get("input_tokens") is not None:
+                        prompt_tokens = (prompt_tokens or 0) + metadata["input_tokens"]
+                    if metadata.get("output_tokens") is not None:
+                        completion_tokens = (completion_tokens or 0) + metadata["output_tokens"]
+        estimated = prompt_tokens is None or completion_tokens is None
+        if prompt_tokens is None:
+            prompt_tokens = estimate_tokens(prompt)
+        if completion_tokens is None:
+            completion_tokens = estimate_tokens("\n".join(
+                generation.text for generations in response.generations for generation in generations
+            ))
+        self.ledger.record(
+            llm_output.get("model_name") or self.model,
+            prompt_tokens,
+            completion_tokens,
+            (time.perf_counter() - started) * 1000,
+            stage=self.stage,
+            estimated_tokens=estimated
+        )
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._started.pop(run_id, None)
+        self._prompts.pop(run_id, None)
@@ -1,8 +1,36 @@
 import re
 import json
+import time
 import asyncio
+import itertools
+from contextlib import asynccontextmanager
 from typing import Dict, List, Any
 import logging
+from urllib.parse import urlsplit
+
+from src.Utilities.url_utils import CrawlScope, DEFAULT_DENIED_QUERY_PARAMS, fetchable_url
+from src.Utilities.crawl_cache import CrawlCache, content_hash
+from src.Utilities.rate_limit import HostRateLimiter
+from src.Utilities.site_graph import SiteGraph
+from src.Utilities.feature_schema import feature_schema_json, parse_page_features, parse_batched_page_features
+from src.Utilities.token_budget import estimate_tokens, hit_token_limit, pack_by_token_budget
+from src.Utilities.llm_ledger import llm_stage
+from src.Utilities.page_templates import page_fingerprint, page_template, url_pattern
+from src.Utilities.static_fetcher import (
+    StaticFetcher,
+    extract_static_structure,
+    html_looks_js_rendered,
+    ELEMENT_RANK_WEIGHTS,
+    MAIN_CONTENT_SELECTOR,
+    PAGE_CHROME_SELECTOR
+)
+from src.Utilities.sitemap import discover_sitemap_urls, ROBOTS_USER_AGENT, MAX_SITEMAP_URLS
+from src.Utilities.load_profiles import (
+    DEFAULT_LOAD_PROFILE,
+    resolve_load_profile,
+    install_resource_blocking,
+    navigate
+)
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -12,25 +40,152 @@ logger = logging.getLogger(__name__)
 MAX_ELEMENTS_PER_PAGE = 30  # Limit number of elements to analyze per page
 MAX_TEXT_LENGTH = 150       # Truncate text content to reduce token usage
 MAX_FORMS_PER_PAGE = 5      # Limit number of forms to analyze per page
+MAX_INPUTS_PER_FORM = 8     # Limit number of inputs/buttons to analyze per form
 MAX_FEATURES_PER_CHUNK = 8  # Process features in smaller chunks
+MAX_CONCURRENT_PAGES = 4    # Crawl workers (and pooled browser contexts) running at once
+MAX_SKELETON_DEPTH = 10     # DOM depth considered when fingerprinting page templates
+PIPELINE_QUEUE_SIZE = 8     # Pages buffered between discovery pipeline stages
+MAX_PROMPT_LINKS = 15       # Outgoing links listed in a page's scenario prompt
+MAX_CONCURRENT_LLM_CALLS = 4  # Pages sent to the model at the same time
+MAX_FEATURE_ATTEMPTS = 3    # Feature calls per page before falling back to a generic feature
+BATCH_TOKEN_BUDGET = 2000   # Prompt tokens of page payload packed into one LLM request
+MAX_PAGES_PER_BATCH = 5     # Pages per batched request, so the answers fit the output limit
+MAX_BATCH_OUTPUT_TOKENS = 5000  # Expected response tokens per batch, well under the agents' max_tokens
+EXPECTED_FEATURE_TOKENS_PER_PAGE = 700     # 5-8 features with edge cases, as compact JSON
+EXPECTED_SCENARIO_TOKENS_PER_FEATURE = 350  # A feature's Gherkin scenarios
+MAX_COUNTED_INBOUND_LINKS = 10  # Inbound links beyond this don't raise a URL's priority any further
+# Checked in order; the first purpose with a matching keyword wins
+FORM_PURPOSE_KEYWORDS = {
+    "login": ["login", "sign in", "log in"],
+    "registration": ["register", "sign up", "create account"],
+    "contact": ["contact", "message", "feedback"],
+    "search": ["search", "find"]
+}
+# Links to login, signup, search and transactional flows are crawled first
+HIGH_VALUE_KEYWORDS = (
+    FORM_PURPOSE_KEYWORDS["login"] + FORM_PURPOSE_KEYWORDS["registration"] + ["search"]
+    + ["signin", "signup", "checkout", "cart", "basket", "payment", "subscribe"]
+)
 
-async def analyze_element(element):
-    """Extract information about an interactive element"""
-    tag_name = await element.evaluate("el => el.tagName.toLowerCase()")
-    element_type = tag_name
-    
-    # Get common attributes
-    attrs = await element.evaluate("""el => {
+# Frontier scoring (see link_priority)
+PRIORITY_WEIGHTS = {
+    "keyword": 10,         # Anchor text or path mentions a high-value flow
+    "crawl_depth": 3,      # Per link hop from the start page
+    "path_depth": 1,       # Per URL path segment
+    "inbound_link": 1,     # Per page linking to the URL
+    "template_seen": 8,    # A page with the same URL pattern was already crawled
+    "sitemap_recency": 6   # Sitemap seeds, scaled from newest lastmod (full) to oldest (none)
+}
+FETCH_MODES = ("hybrid", "browser")
+DEFAULT_FETCH_MODE = "hybrid"  # Try plain HTTP before opening a page in the browser
+
+# Single in-page extraction pass: one CDP round trip returns everything the
+# Python post-processing below needs for a page
+EXTRACTION_SCRIPT = """
+({maxElements, maxForms, maxFormInputs, maxText, maxSkeletonDepth, rankWeights, mainContentSelector, pageChromeSelector}) => {
+    const textOf = el => (el.textContent || '').trim().substring(0, maxText);
+    const attributesOf = el => {
         const attributes = {};
-        for(let i = 0; i < el.attributes.length; i++) {
+        for (let i = 0; i < el.attributes.length; i++) {
             const attr = el.attributes[i];
             attributes[attr.name] = attr.value;
         }
         return attributes;
-    }""")
+    };
+    const describe = el => ({
+        tag: el.tagName.toLowerCase(),
+        attributes: attributesOf(el),
+        text: textOf(el)
+    });
+
+    // Rank elements instead of taking them in DOM order, which on most sites
+    // means the first maxElements are header chrome
+    const isVisible = el => {
+        if (el.type === 'hidden' || !el.getClientRects().length) {
+            return false;
+        }
+        const style = getComputedStyle(el);
+        return style.visibility !== 'hidden' && style.display !== 'none';
+    };
+    const rankOf = el => {
+        let rank = 0;
+        if (isVisible(el)) rank += rankWeights.visible;
+        if (el.closest(mainContentSelector)) rank += rankWeights.mainContent;
+        else if (el.closest(pageChromeSelector)) rank += rankWeights.pageChrome;
+        if (el.closest('form')) rank += rankWeights.inForm;
+        if (el.tagName !== 'A') rank += rankWeights.control;
+        return rank;
+    };
+    const interactive = Array.from(document.querySelectorAll('a, button, input, select, textarea'));
+    const elements = interactive
+        .map((el, index) => ({el, index, rank: rankOf(el)}))
+        .sort((a, b) => b.rank - a.rank || a.index - b.index)
+        .slice(0, maxElements)
+        .map(ranked => describe(ranked.el));
+
+    const forms = Array.from(document.querySelectorAll('form')).slice(0, maxForms).map(form => ({
+        action: form.action || '',
+        method: form.method || 'get',
+        text: (form.textContent || '').substring(0, maxText),
+        inputs: Array.from(form.querySelectorAll('input, select, textarea')).slice(0, maxFormInputs).map(describe),
+        buttons: Array.from(form.querySelectorAll('button')).slice(0, maxFormInputs).map(describe)
+    }));
+
+    // Every anchor on the page is harvested for the crawl frontier,
+    // independently of which elements were picked for detailed analysis.
+    // a.href is already resolved against the final URL and any <base href>
+    const links = [];
+    const seenHrefs = new Set();
+    for (const a of document.querySelectorAll('a[href]')) {
+        const href = a.href;
+        if (!seenHrefs.has(href)) {
+            seenHrefs.add(href);
+            links.push({href: href, text: textOf(a)});
+        }
+    }
+
+    // Tag/role skeleton used to cluster pages rendered from the same template
+    const ignoredTags = ['SCRIPT', 'STYLE', 'NOSCRIPT', 'TEMPLATE', 'LINK', 'META'];
+    const skeletonOf = (el, depth) => {
+        const role = el.getAttribute('role');
+        const name = el.tagName.toLowerCase() + (role ? '[' + role + ']' : '');
+        if (depth >= maxSkeletonDepth) {
+            return name;
+        }
+        const parts = [];
+        for (const child of el.children) {
+            if (ignoredTags.includes(child.tagName)) {
+                continue;
+            }
+            const part = skeletonOf(child, depth + 1);
+            // Collapse repeated siblings so item counts don't change the skeleton
+            if (part !== parts[parts.length - 1]) {
+                parts.push(part);
+            }
+        }
+        return parts.length ? name + '(' + parts.join(',') + ')' : name;
+    };
+
+    return {
+        title: document.title,
+        total_elements: interactive.length,
+        total_links: links.length,
+        elements: elements,
+        forms: forms,
+        links: links,
+        skeleton: document.body ? skeletonOf(document.body, 0) : ''
+    };
+}
+"""
+
+def analyze_element(element_data):
+    """Extract information about an interactive element from the extraction payload"""
+    tag_name = element_data["tag"]
+    element_type = tag_name
     
-    # Get text content (truncated to reduce tokens)
-    text_content = await element.evaluate(f"el => el.textContent.trim().substring(0, {MAX_TEXT_LENGTH})")
+    # Common attributes and text content (already truncated in the page)
+    attrs = element_data.get("attributes", {})
+    text_content = element_data.get("text", "")
     
     # Determine element purpose
     element_info = {
@@ -59,21 +214,18 @@ async def analyze_element(element):
             
     return element_info
 
-async def analyze_form(form):
-    """Extract information about a form"""
+def analyze_form(form_data):
+    """Extract information about a form from the extraction payload"""
     form_info = {
         "inputs": [],
         "submit": None,
-        "action": await form.evaluate("form => form.action || ''"),
-        "method": await form.evaluate("form => form.method || 'get'")
+        "action": form_data.get("action", ""),
+        "method": form_data.get("method", "get")
     }
     
-    # Get form inputs (limit to reduce token usage but increased)
-    inputs = await form.query_selector_all("input, select, textarea")
-    for i, input_el in enumerate(inputs):
-        if i >= 8:  # Increased from 5
-            break
-        input_info = await analyze_element(input_el)
+    # Form inputs (already limited to MAX_INPUTS_PER_FORM in the page)
+    for input_data in form_data.get("inputs", []):
+        input_info = analyze_element(input_data)
         form_info["inputs"].append(input_info)
         
         # Identify submit button
@@ -82,306 +234,1206 @@ async def analyze_form(form):
             
     # If no submit input found, look for submit buttons
     if not form_info["submit"]:
-        buttons = await form.query_selector_all("button")
-        for button in buttons:
-            button_info = await analyze_element(button)
+        for button_data in form_data.get("buttons", []):
+            button_info = analyze_element(button_data)
             if button_info.get("is_submit", False) or "submit" in button_info.get("text", "").lower():
                 form_info["submit"] = button_info
                 break
                 
     # Try to determine form purpose
-    form_text = await form.evaluate(f"form => form.textContent.substring(0, {MAX_TEXT_LENGTH})")
+    form_text = form_data.get("text", "")
     form_info["likely_purpose"] = "form submission"
     
-    if any(keyword in form_text.lower() for keyword in ["login", "sign in", "log in"]):
-        form_info["likely_purpose"] = "login"
-    elif any(keyword in form_text.lower() for keyword in ["register", "sign up", "create account"]):
-        form_info["likely_purpose"] = "registration"
-    elif any(keyword in form_text.lower() for keyword in ["contact", "message", "feedback"]):
-        form_info["likely_purpose"] = "contact"
-    elif any(keyword in form_text.lower() for keyword in ["search", "find"]):
-        form_info["likely_purpose"] = "search"
+    for purpose, keywords in FORM_PURPOSE_KEYWORDS.items():
+        if any(keyword in form_text.lower() for keyword in keywords):
+            form_info["likely_purpose"] = purpose
+            break
         
     return form_info
 
-async def crawl_subpage(url, discovered_pages, navigation_map, depth=0, max_depth=2):
-    """Crawl a subpage and extract its structure"""
-    # Skip if we've reached max depth or already visited
-    if depth > max_depth or url in discovered_pages:
-        return
+async def extract_page_structure(page):
+    """Run the extraction script once and return its raw JSON payload"""
+    return await page.evaluate(EXTRACTION_SCRIPT, {
+        "maxElements": MAX_ELEMENTS_PER_PAGE,
+        "maxForms": MAX_FORMS_PER_PAGE,
+        "maxFormInputs": MAX_INPUTS_PER_FORM,
+        "maxText": MAX_TEXT_LENGTH,
+        "maxSkeletonDepth": MAX_SKELETON_DEPTH,
+        "rankWeights": ELEMENT_RANK_WEIGHTS,
+        "mainContentSelector": MAIN_CONTENT_SELECTOR,
+        "pageChromeSelector": PAGE_CHROME_SELECTOR
+    })
+
+class BrowserPool:
+    """One long-lived Chromium browser with a bounded pool of reusable contexts/pages.
+
+    _idle holds (context, page) pairs ready for reuse, and None for each
+    slot freed by a discarded page, which the next acquire() fills with a
+    new context.
+    """
+
+    def __init__(self, size=MAX_CONCURRENT_PAGES, headless=True, load_profile=None, first_party_host=None):
+        self.size = size
+        self.headless = headless
+        self.load_profile = resolve_load_profile(load_profile)
+        self.first_party_host = first_party_host
+        self._playwright = None
+        self._browser = None
+        self._idle = asyncio.Queue()
+        self._created = 0
+        self._lock = asyncio.Lock()
+
+    async def start(self):
+        """Launch Playwright and the shared browser (only once per discovery run)"""
+        if self._browser:
+            return
+        from playwright.async_api import async_playwright
+
+        self._playwright = await async_playwright().start()
+        self._browser = await self._playwright.chromium.launch(headless=self.headless)
+        logger.info(f"Launched shared browser for discovery (pool size {self.size})")
+
+    async def _new_page(self):
+        context = await self._browser.new_context()
+        await install_resource_blocking(context, self.load_profile, self.first_party_host)
+        page = await context.new_page()
+        page.set_default_timeout(self.load_profile["timeout_ms"])
+        return context, page
+
+    async def _fill_slot(self):
+        try:
+            return await self._new_page()
+        except Exception:
+            # Pass the slot on so a waiting acquire() can try again
+            self._idle.put_nowait(None)
+            raise
+
+    async def acquire(self):
+        """Borrow a page, creating a new context lazily until the pool is full"""
+        async with self._lock:
+            # Launch lazily so fully cached crawls never start Chromium
+            await self.start()
+            if self._idle.empty() and self._created < self.size:
+                self._created += 1
+                return await self._fill_slot()
+        idle = await self._idle.get()
+        return idle if idle is not None else await self._fill_slot()
+
+    async def release(self, context, page, discard=False):
+        """Return a page to the pool, or free its slot if it is no longer usable"""
+        if discard or page.is_closed():
+            try:
+                await context.close()
+            except Exception as e:
+                logger.debug(f"Error closing discarded context: {str(e)}")
+            # Wakes a waiting acquire(), which opens a replacement context
+            await self._idle.put(None)
+            return
+        await self._idle.put((context, page))
+
+    @asynccontextmanager
+    async def page(self):
+        """Context manager wrapper around acquire/release"""
+        context, page = await self.acquire()
+        discard = False
+        try:
+            yield page
+        except BaseException:
+            # A failed navigation can leave the page in an unknown state
+            discard = True
+            raise
+        finally:
+            await self.release(context, page, discard=discard)
+
+    async def close(self):
+        """Tear down every context, the browser and Playwright"""
+        while not self._idle.empty():
+            idle = self._idle.get_nowait()
+            if idle is None:
+                continue
+            context, _ = idle
+            try:
+                await context.close()
+            except Exception as e:
+                logger.debug(f"Error closing context: {str(e)}")
+        self._created = 0
+        if self._browser:
+            await self._browser.close()
+            self._browser = None
+        if self._playwright:
+            await self._playwright.stop()
+            self._playwright = None
+
+def link_priority(url, depth, anchor_text="", inbound_links=1, template_seen=False, sitemap_recency=None):
+    """Score a frontier URL; higher scores are crawled first.
+
+    Uses only what discovery already knows before loading the page: the
+    anchor text and path (the same keywords analyze_form looks for), the
+    path depth, how many crawled pages link to it, and whether a page with
+    the same URL pattern (and so probably the same template) was crawled.
+
+    Sitemap seeds pass sitemap_recency (1.0 for the newest lastmod down to
+    0.0 for the oldest), which replaces the path depth term so seeds keep
+    their lastmod order.
+    """
+    haystack = f"{anchor_text} {urlsplit(url).path}".lower()
+    score = -PRIORITY_WEIGHTS["crawl_depth"] * depth
+    if any(keyword in haystack for keyword in HIGH_VALUE_KEYWORDS):
+        score += PRIORITY_WEIGHTS["keyword"]
+    if sitemap_recency is None:
+        score -= PRIORITY_WEIGHTS["path_depth"] * len([segment for segment in urlsplit(url).path.split("/") if segment])
+    else:
+        score += PRIORITY_WEIGHTS["sitemap_recency"] * sitemap_recency
+    score += PRIORITY_WEIGHTS["inbound_link"] * min(inbound_links, MAX_COUNTED_INBOUND_LINKS)
+    if template_seen:
+        score -= PRIORITY_WEIGHTS["template_seen"]
+    return score
+
+class CrawlFrontier:
+    """Priority crawl frontier: a score-ordered queue plus a visited set.
+
+    URLs are scored with link_priority() so that, when a budget cuts the
+    crawl short, form-bearing and transactional pages have already been
+    visited. A queued URL is re-scored every time another page links to it.
+    """
+
+    def __init__(self, max_depth, robots=None):
+        self.max_depth = max_depth
+        self.robots = robots
+        self._queue = asyncio.PriorityQueue()
+        self._visited = set()
+        self._queued = {}          # url -> (priority, depth, anchor text, sitemap recency) while waiting
+        self._fetch_urls = {}      # canonical url -> the link first found to it, which is what gets requested
+        self._inbound = {}         # url -> number of pages linking to it
+        self._seen_patterns = set()
+        self._sequence = itertools.count()
+        self.pending = 0  # queued or being crawled
+
+    def _push(self, url, depth, anchor_text, sitemap_recency=None):
+        priority = link_priority(url, depth, anchor_text, self._inbound.get(url, 1),
+                                 url_pattern(url) in self._seen_patterns, sitemap_recency)
+        queued = self._queued.get(url)
+        self._queued[url] = (priority, depth, anchor_text, sitemap_recency)
+        # An unchanged score keeps its heap entry; get() still accepts it
+        if queued is None or queued[0] != priority:
+            # Best score first, then discovery order among equal scores
+            self._queue.put_nowait((-priority, next(self._sequence), url))
+
+    def add(self, url, depth, anchor_text="", sitemap_recency=None, fetch_url=None):
+        """Queue a canonical URL unless it is too deep or already visited.
+
+        The check and the insert happen without an await in between, so the
+        visited set is updated atomically with respect to the other workers.
+        Adding a URL that is still waiting counts as one more inbound link.
+        fetch_url is the link as found (defaults to url); the first one seen
+        is the one requested.
+        """
+        if depth > self.max_depth:
+            return False
+        if url in self._visited:
+            self._inbound[url] = self._inbound.get(url, 1) + 1
+            if url in self._queued:
+                _, queued_depth, queued_text, queued_recency = self._queued[url]
+                # A changed score leaves the old heap entry stale; get() skips it
+                self._push(url, queued_depth, queued_text or anchor_text, queued_recency)
+            return False
+        if self.robots and depth > 0 and not self.robots.can_fetch(ROBOTS_USER_AGENT, url):
+            logger.info(f"Skipping {url}: disallowed by robots.txt")
+            return False
+        self._visited.add(url)
+        self._fetch_urls[url] = fetch_url or url
+        self._push(url, depth, anchor_text, sitemap_recency)
+        self.pending += 1
+        return True
+
+    def seed(self, urls, depth):
+        """Queue sitemap (url, fetch url) pairs, given newest lastmod first, keeping that order as a priority term"""
+        urls = list(urls)
+        return sum(
+            self.add(url, depth, sitemap_recency=1 - rank / len(urls), fetch_url=fetch_url)
+            for rank, (url, fetch_url) in enumerate(urls)
+        )
+
+    def fetch_url(self, url):
+        """The URL to request for a queued canonical URL"""
+        return self._fetch_urls.get(url, url)
+
+    def mark_crawled(self, url):
+        """Record the URL's pattern so later pages of the same template rank lower"""
+        self._seen_patterns.add(url_pattern(url))
+
+    async def get(self):
+        while True:
+            negative_priority, _, url = await self._queue.get()
+            queued = self._queued.get(url)
+            if queued is not None and queued[0] == -negative_priority:
+                del self._queued[url]
+                return url, queued[1]
+            # Superseded by a re-scored entry
+            self._queue.task_done()
+
+    def task_done(self):
+        self.pending -= 1
+        self._queue.task_done()
+
+    async def join(self):
+        await self._queue.join()
+
+class CrawlBudget:
+    """Page, wall-clock and element limits for one discovery run.
+
+    Any limit left as None is unlimited. Once a limit is hit, `exhausted`
+    names it and the crawl stops taking new pages.
+    """
+
+    def __init__(self, max_pages=None, max_seconds=None, max_elements=None):
+        self.max_pages = max_pages
+        self.max_seconds = max_seconds
+        self.max_elements = max_elements
+        self.started = time.monotonic()
+        self.pages = 0
+        self.elements = 0
+        self.exhausted = None
+
+    def remaining_seconds(self):
+        if self.max_seconds is None:
+            return None
+        return max(self.max_seconds - (time.monotonic() - self.started), 0)
+
+    def claim_page(self):
+        """Reserve budget for one more page; False once any limit is used up"""
+        if not self.exhausted and self.remaining_seconds() == 0:
+            self.exhausted = "max_seconds"
+        if not self.exhausted and self.max_pages is not None and self.pages >= self.max_pages:
+            self.exhausted = "max_pages"
+        if self.exhausted:
+            return False
+        self.pages += 1
+        return True
+
+    def record_elements(self, count):
+        self.elements += count
+        if self.max_elements is not None and self.elements >= self.max_elements and not self.exhausted:
+            self.exhausted = "max_elements"
+
+def build_page_data(url, payload):
+    """Turn an extraction payload (browser or static) into page_data and its links"""
+    page_data = {"title": payload.get("title", ""), "elements": [], "forms": []}
+    
+    # Limit number of elements to process, but increased
+    logger.info(f"Processing {len(payload['elements'])} out of {payload['total_elements']} elements "
+                f"and {len(payload['links'])} links on {url}")
+    page_data["elements"] = [analyze_element(element) for element in payload["elements"]]
+    
+    # Forms (limited number but increased)
+    for i, form_data in enumerate(payload["forms"]):
+        try:
+            form_info = analyze_form(form_data)
+            page_data["forms"].append(form_info)
+        except Exception as form_e:
+            logger.error(f"Error analyzing form {i} on {url}: {str(form_e)}")
+            
+    page_data["template"] = page_fingerprint(payload.get("skeleton", ""), page_data["forms"])
+    return page_data, payload["links"]
+
+async def _server_html(response):
+    """(body, headers) of a navigation's HTML response, or None if unavailable"""
+    if response is None:
+        return None
+    try:
+        return await response.body(), response.headers
+    except Exception as e:
+        logger.debug(f"No response body for {response.url}: {str(e)}")
+        return None
+
+async def load_page_structure(url, browser_pool, crawl_cache=None, cached=None):
+    """Load a page in the browser and extract its structure.
+
+    Returns (page_data, links, reused). When the server's HTML doesn't look
+    JS-rendered (as in browser fetch mode, which sends every page here), it
+    is hashed and stored with its ETag/Last-Modified like a static fetch,
+    and a cached entry with the same hash is reused without extracting.
+    For JS-rendered pages the shell HTML (and its ETag) rarely changes when
+    the rendered content does, so the rendered DOM is always extracted and
+    stored without validators or hash, so it is never revalidated or reused.
+    """
+    html_hash = headers = None
+    async with browser_pool.page() as page:
+        response, load_time_ms = await navigate(page, url, browser_pool.load_profile)
+        logger.info(f"Loaded {url} in {load_time_ms} ms")
         
+        server_html = await _server_html(response) if crawl_cache else None
+        if server_html and not html_looks_js_rendered(server_html[0]):
+            html_hash = content_hash(server_html[0])
+            headers = server_html[1]
+        if cached and html_hash and cached["content_hash"] == html_hash:
+            logger.info(f"Content unchanged since last crawl, reusing cached structure for {url}")
+            payload = None
+        else:
+            # Pull title, elements, forms and links in a single round trip
+            payload = await extract_page_structure(page)
+    
+    if payload is None:
+        page_data, links, reused = cached["page_data"], cached["links"], True
+    else:
+        page_data, links = build_page_data(url, payload)
+        page_data["fetch_mode"] = "browser"
+        reused = False
+    if crawl_cache:
+        if html_hash:
+            crawl_cache.put(url, page_data, links, headers.get("etag"), headers.get("last-modified"), html_hash)
+        else:
+            crawl_cache.put(url, page_data, links)
+    page_data["load_time_ms"] = load_time_ms
+    return page_data, links, reused
+
+async def load_static_page_structure(url, static_fetcher, crawl_cache=None, cached=None):
+    """Fetch a page over plain HTTP and extract its structure without a browser.
+
+    Returns (page_data, links, reused) like load_page_structure, or None when
+    the page can't be fetched statically or looks JS-rendered, in which case
+    the caller escalates to the browser.
+    """
+    fetched = await static_fetcher.fetch(url)
+    if fetched is None:
+        return None
+    body, headers, load_time_ms, final_url = fetched
+    html_hash = content_hash(body)
+    
+    # Only a structure that was itself extracted from static HTML can stand in
+    # for it; a browser-rendered entry must be re-rendered, not matched by its shell
+    if cached and cached["page_data"].get("fetch_mode") == "static" and cached["content_hash"] == html_hash:
+        logger.info(f"Content unchanged since last crawl, reusing cached structure for {url}")
+        page_data, links, reused = cached["page_data"], cached["links"], True
+    else:
+        payload = extract_static_structure(
+            body.decode("utf-8", errors="replace"), final_url,
+            MAX_ELEMENTS_PER_PAGE, MAX_FORMS_PER_PAGE, MAX_INPUTS_PER_FORM, MAX_TEXT_LENGTH, MAX_SKELETON_DEPTH
+        )
+        if payload is None:
+            return None
+        page_data, links = build_page_data(url, payload)
+        page_data["fetch_mode"] = "static"
+        reused = False
+    
+    logger.info(f"Fetched {url} statically in {load_time_ms} ms")
+    if crawl_cache:
+        crawl_cache.put(url, page_data, links, headers.get("etag"), headers.get("last-modified"), html_hash)
+    page_data["load_time_ms"] = load_time_ms
+    return page_data, links, reused
+
+async def crawl_subpage(url, discovered_pages, navigation_map, browser_pool, crawl_scope,
+                        depth=0, max_depth=2, crawl_cache=None, rate_limiter=None, static_fetcher=None,
+                        fetch_url=None):
+    """Crawl a subpage, extract its structure and return the child URLs to visit next.
+
+    url is the page's canonical URL, which keys discovered_pages and the site
+    graph; fetch_url (default url) is what is requested and cached. The
+    child URLs are returned as a dict mapping each canonical URL to
+    (anchor text, fetch url).
+    """
     logger.info(f"Crawling subpage: {url} (depth {depth})")
-    discovered_pages[url] = {"title": "", "elements": [], "forms": []}
+    rate_limiter = rate_limiter or HostRateLimiter()
+    fetch_url = fetch_url or url
+    child_urls = {}
     
     try:
-        from playwright.async_api import async_playwright
+        cached = crawl_cache.get(fetch_url) if crawl_cache else None
         
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(headless=True)
-            context = await browser.new_context()
-            page = await context.new_page()
-            
-            # Set a longer timeout for page loading
-            page.set_default_timeout(30000)  # 30 seconds
-            
-            await page.goto(url, wait_until="networkidle")
-            
-            # Get page title
-            title = await page.title()
-            discovered_pages[url]["title"] = title
-            
-            # Find all interactive elements (increased number to reduce token usage)
-            logger.info(f"Finding interactive elements on {url}")
-            interactive_elements = await page.query_selector_all('a, button, input, select, textarea')
+        # Cheapest path: the server confirms the cached copy is still current.
+        # Only a conditional GET that is actually sent takes a rate-limit slot
+        unchanged = False
+        if crawl_cache and crawl_cache.revalidation_headers(cached):
+            async with rate_limiter.limit(fetch_url):
+                unchanged = await crawl_cache.is_unchanged(fetch_url, cached)
+        loaded = None
+        if unchanged:
+            logger.info(f"Server reports {fetch_url} unchanged, reusing cached structure")
+            crawl_cache.touch(fetch_url)
+            page_data, links, reused = cached["page_data"], cached["links"], True
+            page_data["load_time_ms"] = 0
+            page_data["fetch_mode"] = "cache"
+            loaded = page_data, links, reused
+        elif static_fetcher:
+            # Server-rendered pages don't need a browser at all
+            async with rate_limiter.limit(fetch_url):
+                loaded = await load_static_page_structure(fetch_url, static_fetcher, crawl_cache, cached)
+        if loaded is None:
+            async with rate_limiter.limit(fetch_url):
+                loaded = await load_page_structure(fetch_url, browser_pool, crawl_cache, cached)
+        page_data, links, reused = loaded
             
-            # Limit number of elements to process, but increased
-            processing_count = min(len(interactive_elements), MAX_ELEMENTS_PER_PAGE)
-            logger.info(f"Processing {processing_count} out of {len(interactive_elements)} elements")
-            
-            for i, element in enumerate(interactive_elements):
-                if i >= MAX_ELEMENTS_PER_PAGE:
-                    break
-                    
-                element_info = await analyze_element(element)
-                discovered_pages[url]["elements"].append(element_info)
+        if crawl_cache:
+            if reused:
+                crawl_cache.hits += 1
+            else:
+                crawl_cache.misses += 1
                 
-                # If it's a link to another page within the same domain, add to navigation map
-                if element_info["tag"] == "a" and "href" in element_info:
-                    href = element_info["href"]
-                    # Check if link is relative or to the same domain
-                    if href and (href.startswith('/') or href.startswith(url.split('/')[0])):
-                        # Convert relative URL to absolute
-                        if href.startswith('/'):
-                            base_url = '/'.join(url.split('/')[:3])  # Get domain part
-                            full_href = base_url + href
-                        else:
-                            full_href = href
-                            
-                        # Add to navigation map
-                        navigation_map[full_href] = {"from": url, "via": element_info["text"]}
-                        
-                        # Recursively crawl if not yet discovered
-                        if full_href not in discovered_pages and depth < max_depth:
-                            await crawl_subpage(full_href, discovered_pages, navigation_map, depth + 1, max_depth)
-            
-            # Find forms (limited number but increased)
-            logger.info(f"Finding forms on {url}")
-            forms = await page.query_selector_all('form')
-            
-            # Limit number of forms to process but increased
-            forms_to_process = min(len(forms), MAX_FORMS_PER_PAGE)
-            for i in range(forms_to_process):
-                try:
-                    form_info = await analyze_form(forms[i])
-                    discovered_pages[url]["forms"].append(form_info)
-                except Exception as form_e:
-                    logger.error(f"Error analyzing form {i} on {url}: {str(form_e)}")
+        page_data["from_cache"] = reused
+        page_data.setdefault("fetch_mode", "browser")
+        discovered_pages[url] = page_data
+        
+        for link in links:
+            # Links arrive absolute, resolved against the page's real URL (after
+            # redirects and <base href>); url is only the canonical dedup key
+            # and must not be used as a base, since it has no trailing slash
+            full_href = crawl_scope.resolve(link["href"], None)
+            if not full_href or full_href == url:
+                continue
                 
-            await browser.close()
+            # Every link is kept as an edge of the site graph
+            navigation_map.add_edge(url, full_href, link["text"])
+            
+            # Hand children back to the frontier instead of recursing
+            if full_href not in discovered_pages and depth < max_depth and full_href not in child_urls:
+                child_urls[full_href] = (link["text"], fetchable_url(link["href"]))
             
     except Exception as e:
         logger.error(f"Error crawling {url}: {str(e)}")
-        
-    return
-
-async def discover_website_structure(start_url, max_depth=2):
-    """Discover the structure of a website starting from a URL"""
-    logger.info(f"Starting website discovery from {start_url}")
-    discovered_pages = {}
-    navigation_map = {}
+        discovered_pages[url] = {"title": "", "elements": [], "forms": []}
     
-    try:
-        await crawl_subpage(start_url, discovered_pages, navigation_map, depth=0, max_depth=max_depth)
-    except Exception as e:
-        logger.error(f"Error in website discovery: {str(e)}")
-        
-    return discovered_pages, navigation_map
+    return child_urls
 
-def identify_features(discovered_pages, navigation_map, qa_agent):
-    """Use AI to identify features from the discovered page structure"""
-    logger.info("Identifying features from discovered pages")
-    all_features = []
+async def crawl_worker(frontier, discovered_pages, navigation_map, browser_pool, crawl_scope,
+                       crawl_cache=None, results=None, budget=None, rate_limiter=None, static_fetcher=None):
+    """Drain the frontier, crawling one page at a time on a pooled browser page"""
+    while True:
+        url, depth = await frontier.get()
+        try:
+            # Once the budget is spent the rest of the frontier is just drained
+            if budget and not budget.claim_page():
+                continue
+            child_urls = await crawl_subpage(url, discovered_pages, navigation_map, browser_pool, crawl_scope,
+                                             depth=depth, max_depth=frontier.max_depth,
+                                             crawl_cache=crawl_cache, rate_limiter=rate_limiter,
+                                             static_fetcher=static_fetcher, fetch_url=frontier.fetch_url(url))
+            if budget:
+                budget.record_elements(len(discovered_pages[url].get("elements", [])))
+            frontier.mark_crawled(url)
+            for child_url, (anchor_text, child_fetch_url) in child_urls.items():
+                frontier.add(child_url, depth + 1, anchor_text, fetch_url=child_fetch_url)
+            # Publish the finished page before marking it done so that
+            # frontier.join() never resolves ahead of the last result
+            if results is not None:
+                results.put_nowait(url)
+        except Exception as e:
+            logger.error(f"Crawl worker failed on {url}: {str(e)}")
+        finally:
+            frontier.task_done()
+
+def _update_crawl_stats(crawl_stats, frontier, discovered_pages, budget):
+    if crawl_stats is not None:
+        crawl_stats["pages_crawled"] = len(discovered_pages)
+        crawl_stats["pages_pending"] = 0 if budget.exhausted else frontier.pending
+        crawl_stats["budget_exhausted"] = budget.exhausted
+
+async def discover_website_pages(start_url, discovered_pages, navigation_map, max_depth=2,
+                                 max_concurrency=MAX_CONCURRENT_PAGES, scope="origin",
+                                 allowed_query_params=None, denied_query_params=DEFAULT_DENIED_QUERY_PARAMS,
+                                 use_cache=True, cache_dir=None, load_profile=DEFAULT_LOAD_PROFILE,
+                                 use_sitemap=False, max_sitemap_urls=MAX_SITEMAP_URLS, crawl_stats=None,
+                                 max_pages=None, max_seconds=None, max_elements=None,
+                                 requests_per_second=None, max_concurrent_per_host=None, shards=1,
+                                 fetch_mode=DEFAULT_FETCH_MODE):
+    """Crawl a website and yield (url, page_data) as soon as each page is extracted.
+
+    discovered_pages and navigation_map (a SiteGraph) are filled in place
+    while crawling, so downstream stages can start on a page before the crawl
+    has finished.
+    Pages are keyed by canonical URL; scope is "origin", "host" or "domain"
+    (see url_utils.is_same_scope). With use_cache, unchanged pages from a
+    previous run are reused from the on-disk CrawlCache under cache_dir.
+    load_profile is a LOAD_PROFILES name or dict deciding which resources are
+    blocked and how page readiness is detected (see load_profiles.py).
+    With use_sitemap, robots.txt and sitemaps seed the frontier up front
+    (newest lastmod first) and robots.txt disallow rules are honored.
+    crawl_stats, when given, is kept up to date with crawl progress counters.
     
-    # Process each discovered page
-    for url, page_data in discovered_pages.items():
-        logger.info(f"Identifying features for page: {url}")
-        page_features = []
-        
-        # Navigation feature
-        if url in navigation_map:
-            nav_info = navigation_map[url]
-            page_features.append({
-                "type": "navigation",
-                "description": f"Navigate to {page_data['title']} page",
-                "from_page": nav_info["from"],
-                "via_element": nav_info["via"]
-            })
-        
-        # Form submission features (increased limit)
-        for i, form in enumerate(page_data.get("forms", [])):
-            if i >= MAX_FORMS_PER_PAGE:
-                break
-                
-            form_feature = {
-                "type": "form",
-                "description": f"Submit {form['likely_purpose']} form",
-                "inputs": form["inputs"][:5],  # Increased from 3
-                "submit_button": form["submit"]
-            }
-            page_features.append(form_feature)
-        
-        # Interactive element features (increased limit)
-        element_count = 0
-        for element in page_data.get("elements", []):
-            if element_count >= 15:  # Increased from 10
-                break
-                
-            if element["tag"] in ["button", "input"] and element.get("type") not in ["hidden"]:
-                action_feature = {
-                    "type": "interaction",
-                    "description": f"Interact with {element.get('text', '') or element.get('tag', 'element')}",
-                    "element": element
-                }
-                page_features.append(action_feature)
-                element_count += 1
+    max_pages, max_seconds and max_elements bound the crawl; when one runs out
+    the pages crawled so far are returned and crawl_stats["budget_exhausted"]
+    names the limit that was hit. requests_per_second and
+    max_concurrent_per_host throttle each host (see rate_limit.py).
+    
+    fetch_mode "hybrid" fetches pages over plain HTTP first and only opens
+    them in the browser when they look JS-rendered (see static_fetcher.py);
+    "browser" always uses the browser. page_data["fetch_mode"] records which
+    path ("static", "browser" or "cache") produced each page.
+    
+    With shards > 1 the crawl is split across that many processes, each with
+    its own browser running max_concurrency pages (see sharded_discovery.py).
+    """
+    if shards > 1:
+        from src.Utilities.sharded_discovery import discover_sharded_pages
         
-        # Skip if no features found
-        if not page_features:
-            continue
-            
-        # Use AI to refine and group features - use a summary approach to reduce tokens
-        logger.info(f"Using AI to refine features for {url}")
+        async for url, page_data in discover_sharded_pages(
+            start_url, discovered_pages, navigation_map, shards, max_depth=max_depth,
+            max_concurrency=max_concurrency, scope=scope, allowed_query_params=allowed_query_params,
+            denied_query_params=denied_query_params, use_cache=use_cache, cache_dir=cache_dir,
+            load_profile=load_profile, use_sitemap=use_sitemap, max_sitemap_urls=max_sitemap_urls,
+            crawl_stats=crawl_stats, max_pages=max_pages, max_seconds=max_seconds,
+            max_elements=max_elements, requests_per_second=requests_per_second,
+            max_concurrent_per_host=max_concurrent_per_host, fetch_mode=fetch_mode
+        ):
+            yield url, page_data
+        return
         
-        # First create a compact summary of the features
-        summary_prompt = f"""
-        Summarize these raw page features in a compact format:
-        Page title: "{page_data['title']}"
-        URL: "{url}"
-        Feature count: {len(page_features)}
+    logger.info(f"Starting website discovery from {start_url} ({max_concurrency} parallel pages)")
+    frontier = CrawlFrontier(max_depth)
+    crawl_scope = CrawlScope(start_url, scope, allowed_query_params, denied_query_params)
+    navigation_map.start_url = crawl_scope.start_url
+    browser_pool = BrowserPool(size=max_concurrency, load_profile=load_profile,
+                               first_party_host=urlsplit(crawl_scope.start_url).hostname)
+    crawl_cache = CrawlCache(cache_dir) if use_cache else None
+    budget = CrawlBudget(max_pages, max_seconds, max_elements)
+    rate_limiter = HostRateLimiter(requests_per_second, max_concurrent_per_host=max_concurrent_per_host)
+    static_fetcher = StaticFetcher() if fetch_mode == "hybrid" else None
+    results = asyncio.Queue()
+    workers = []
+    crawl_done = None
+    
+    try:
+        frontier.add(crawl_scope.start_url, 0, fetch_url=fetchable_url(start_url))
         
-        Return a brief summary in 150 words or less.
-        """
+        if use_sitemap:
+            seed_urls, frontier.robots = await discover_sitemap_urls(crawl_scope.start_url, crawl_scope, max_sitemap_urls)
+            # Sitemaps already enumerate the site, so seeded pages are analyzed
+            # at the depth limit and don't expand the frontier any further
+            seeded = frontier.seed(seed_urls, max_depth)
+            logger.info(f"Seeded frontier with {seeded} sitemap URLs")
+        workers = [
+            asyncio.create_task(crawl_worker(frontier, discovered_pages, navigation_map, browser_pool,
+                                             crawl_scope, crawl_cache, results, budget, rate_limiter,
+                                             static_fetcher))
+            for _ in range(max_concurrency)
+        ]
+        crawl_done = asyncio.create_task(frontier.join())
         
-        try:
-            summary_response = qa_agent.run(summary_prompt)
-            
-            # Now use the summary to identify key features - INCREASED NUMBER
-            feature_prompt = f"""
-            Given this page summary: "{summary_response.content}"
-            
-            Identify 5-8 main features for testing on this page. Be comprehensive and include edge cases.
+        while True:
+            next_result = asyncio.create_task(results.get())
+            await asyncio.wait({next_result, crawl_done}, timeout=budget.remaining_seconds(),
+                               return_when=asyncio.FIRST_COMPLETED)
+            if not next_result.done():
+                next_result.cancel()
+                if not crawl_done.done():
+                    # Out of time: stop now instead of waiting on in-flight page loads
+                    budget.exhausted = "max_seconds"
+                break
+            url = next_result.result()
+            _update_crawl_stats(crawl_stats, frontier, discovered_pages, budget)
+            yield url, discovered_pages[url]
             
-            Return a JSON array where each item has:
-            1. "name": A descriptive name for the feature (max 10 words)
-            2. "type": Either "navigation", "form", "interaction", "validation", or "content"
-            3. "description": What user goal this feature serves (max 15 words)
-            4. "edge_cases": Array of 1-3 potential edge cases to test (optional)
+        if budget.exhausted:
+            logger.warning(f"Crawl budget exhausted ({budget.exhausted}); returning partial results")
             
-            Include at least one validation feature if forms are present.
-            """
+        # The crawl is over; hand out whatever finished alongside the last page
+        while not results.empty():
+            url = results.get_nowait()
+            _update_crawl_stats(crawl_stats, frontier, discovered_pages, budget)
+            yield url, discovered_pages[url]
+    except Exception as e:
+        logger.error(f"Error in website discovery: {str(e)}")
+    finally:
+        if crawl_done:
+            crawl_done.cancel()
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        # Tear down the shared browser once for the whole crawl
+        await browser_pool.close()
+        if static_fetcher:
+            await static_fetcher.close()
+        if crawl_cache:
+            logger.info(f"Crawl cache: {crawl_cache.hits} pages reused, {crawl_cache.misses} re-extracted")
+            await crawl_cache.close()
+        load_times = [page["load_time_ms"] for page in discovered_pages.values() if page.get("load_time_ms")]
+        if load_times:
+            logger.info(f"Average page load time: {sum(load_times) / len(load_times):.0f} ms over {len(load_times)} pages")
+        _update_crawl_stats(crawl_stats, frontier, discovered_pages, budget)
+
+async def discover_website_structure(start_url, max_depth=2, max_concurrency=MAX_CONCURRENT_PAGES, **crawl_options):
+    """Discover the structure of a website starting from a URL.
+
+    Runs discover_website_pages to completion; see it for crawl_options.
+    """
+    discovered_pages = {}
+    navigation_map = SiteGraph()
+    
+    async for _ in discover_website_pages(start_url, discovered_pages, navigation_map, max_depth=max_depth,
+                                          max_concurrency=max_concurrency, **crawl_options):
+        pass
+        
+    return discovered_pages, navigation_map
+
+def raw_page_features(url, page_data, navigation_map):
+    """Features found directly in a page's structure, before the model refines them"""
+    page_features = []
+    
+    # Navigation feature. The start page, and sitemap seeds nothing links to
+    # yet (the pipeline analyzes pages while the crawl is still running),
+    # are opened directly
+    if url in navigation_map and url != navigation_map.start_url:
+        nav_info = navigation_map[url]
+        page_features.append({
+            "type": "navigation",
+            "description": f"Navigate to {page_data['title']} page",
+            "from_page": nav_info["from"],
+            "via_element": nav_info["via"],
+            "navigation_step": navigation_map.navigation_step(url)
+        })
+    else:
+        page_features.append({
+            "type": "navigation",
+            "description": f"Open {page_data['title']} page",
+            "navigation_step": f'Given I am on "{url}"'
+        })
+    
+    # Form submission features (increased limit)
+    for i, form in enumerate(page_data.get("forms", [])):
+        if i >= MAX_FORMS_PER_PAGE:
+            break
             
-            feature_response = qa_agent.run(feature_prompt)
-            try:
-                # Try to parse as JSON
-                refined_features = json.loads(feature_response.content)
-            except:
-                # If parsing fails, create a simple feature list
-                logger.warning(f"Could not parse AI response as JSON for {url}")
-                refined_features = [{
-                    "name": f"Page: {page_data['title']}",
-                    "type": "content",
-                    "description": f"View and interact with {page_data['title']}",
-                    "edge_cases": ["Page loads with missing content", "Page loads with network issues"]
-                }]
+        form_feature = {
+            "type": "form",
+            "description": f"Submit {form['likely_purpose']} form",
+            "inputs": form["inputs"][:5],  # Increased from 3
+            "submit_button": form["submit"]
+        }
+        page_features.append(form_feature)
+    
+    # Interactive element features (increased limit)
+    element_count = 0
+    for element in page_data.get("elements", []):
+        if element_count >= 15:  # Increased from 10
+            break
             
-            for feature in refined_features:
-                feature["page_url"] = url
-                feature["page_title"] = page_data["title"]
-                all_features.append(feature)
-                
+        if element["tag"] in ["button", "input"] and element.get("type") not in ["hidden"]:
+            action_feature = {
+                "type": "interaction",
+                "description": f"Interact with {element.get('text', '') or element.get('tag', 'element')}",
+                "element": element
+            }
+            page_features.append(action_feature)
+            element_count += 1
+    
+    return page_features
+
+def _compact_element(element):
+    """Only the element fields that tell the model what the control is"""
+    attrs = element.get("attributes", {})
+    compact = {
+        "tag": element.get("tag"),
+        "text": element.get("text"),
+        "type": element.get("input_type"),
+        "name": element.get("name") or attrs.get("id"),
+        "placeholder": element.get("placeholder"),
+        "label": attrs.get("aria-label")
+    }
+    return {key: value for key, value in compact.items() if value}
+
+def compact_page_features(page_features):
+    """One JSON line per raw feature, without empty fields or full attribute dicts"""
+    lines = []
+    for feature in page_features:
+        compact = {"type": feature["type"], "description": feature["description"]}
+        if feature["type"] == "navigation":
+            if feature.get("via_element") is not None:
+                compact["via"] = feature["via_element"]
+        elif feature["type"] == "form":
+            compact["inputs"] = [_compact_element(input_info) for input_info in feature.get("inputs", [])]
+            if feature.get("submit_button"):
+                compact["submit"] = _compact_element(feature["submit_button"])
+        elif feature.get("element"):
+            compact["element"] = _compact_element(feature["element"])
+        lines.append(json.dumps(compact, separators=(",", ":")))
+    return "\n    ".join(lines)
+
+def _truncated(qa_agent, response):
+    """Whether the response was probably cut off at the agent's max_tokens"""
+    return hit_token_limit(response, getattr(getattr(qa_agent, "model", None), "max_tokens", None))
+
+def _ask_validated(qa_agent, prompt, parse, label):
+    """Run a schema-constrained prompt, retrying only when the response fails validation.
+
+    Returns the parsed result, or None if the model call fails, every
+    attempt is rejected, or a rejected response was cut off at max_tokens
+    (asking again would only cut it off again).
+    """
+    request = prompt
+    for attempt in range(MAX_FEATURE_ATTEMPTS):
+        try:
+            with llm_stage("feature_identification"):
+                response = qa_agent.run(request)
         except Exception as e:
-            logger.error(f"Error processing AI response for {url}: {str(e)}")
+            logger.error(f"Error processing AI response for {label}: {str(e)}")
+            return None
+        try:
+            return parse(response.content)
+        except ValueError as e:
+            # Don't let a rejected response be replayed from the LLM cache
+            if hasattr(qa_agent, "forget"):
+                qa_agent.forget(request)
+            if _truncated(qa_agent, response):
+                logger.warning(f"Feature response for {label} hit the output token limit")
+                return None
+            # Only a response that doesn't match the schema is worth a retry
+            logger.warning(f"Feature response for {label} failed validation (attempt {attempt + 1}): {str(e)[:200]}")
+            request = f"""{prompt}
+    Your previous response was rejected: {str(e)[:500]}
+    Return only JSON that matches the schema.
+    """
+    return None
+
+def _with_page(features, url, page_data):
+    for feature in features:
+        feature["page_url"] = url
+        feature["page_title"] = page_data["title"]
+    return features
+
+def identify_page_features(url, page_data, navigation_map, qa_agent):
+    """Use AI to identify the features of a single discovered page"""
+    logger.info(f"Identifying features for page: {url}")
+    page_features = raw_page_features(url, page_data, navigation_map)
     
-    return all_features
+    # Skip if no features found
+    if not page_features:
+        return []
+        
+    # One schema-constrained call over a compact view of the raw features
+    logger.info(f"Using AI to refine features for {url}")
+    feature_prompt = f"""
+    Identify 5-8 main features for testing on this page. Be comprehensive and include edge cases.
+    
+    Page title: "{page_data['title']}"
+    URL: "{url}"
+    Raw page features (forms, interactive elements, navigation):
+    {compact_page_features(page_features)}
+    
+    Feature types: "navigation", "form", "interaction", "validation" or "content".
+    Include at least one validation feature if forms are present.
+    
+    Respond with only a JSON object (no markdown) matching this JSON schema:
+    {feature_schema_json()}
+    """
+    
+    refined_features = _ask_validated(qa_agent, feature_prompt, parse_page_features, url)
+    if refined_features is None:
+        logger.warning(f"Could not get valid features for {url}, using a generic content feature")
+        refined_features = [{
+            "name": f"Page: {page_data['title']}",
+            "type": "content",
+            "description": f"View and interact with {page_data['title']}",
+            "edge_cases": ["Page loads with missing content", "Page loads with network issues"]
+        }]
+    
+    return _with_page(refined_features, url, page_data)
 
-def generate_scenarios_from_features(all_features, navigation_map, qa_agent):
-    """Generate Gherkin scenarios from identified features"""
-    logger.info("Generating Gherkin scenarios from features")
+def identify_batch_features(urls, discovered_pages, navigation_map, qa_agent):
+    """Identify features for several pages with a single model call.
+
+    Returns {url: features}. Pages the batched response leaves out, or a
+    batch whose response never validates, fall back to identify_page_features.
+    """
+    raw_features = {url: raw_page_features(url, discovered_pages[url], navigation_map) for url in urls}
+    results = {url: [] for url in urls}
+    pending = [url for url in urls if raw_features[url]]
+    if len(pending) <= 1:
+        for url in pending:
+            results[url] = identify_page_features(url, discovered_pages[url], navigation_map, qa_agent)
+        return results
     
-    # Group features by page
+    logger.info(f"Using AI to refine features for {len(pending)} pages in one request")
+    page_sections = "\n".join(f"""
+    PAGE URL: "{url}"
+    Page title: "{discovered_pages[url]['title']}"
+    Raw page features (forms, interactive elements, navigation):
+    {compact_page_features(raw_features[url])}
+    """ for url in pending)
+    feature_prompt = f"""
+    For each of the {len(pending)} pages below, identify 5-8 main features for testing. Be comprehensive and include edge cases.
+    {page_sections}
+    Feature types: "navigation", "form", "interaction", "validation" or "content".
+    Include at least one validation feature for every page that has forms.
+    
+    Respond with only a JSON object (no markdown) matching this JSON schema, with one
+    entry in "pages" for every page above, keyed by its exact PAGE URL:
+    {feature_schema_json(batched=True)}
+    """
+    
+    refined = _ask_validated(qa_agent, feature_prompt, parse_batched_page_features, f"{len(pending)} pages") or {}
+    for url in pending:
+        if refined.get(url):
+            results[url] = _with_page(refined[url], url, discovered_pages[url])
+        else:
+            logger.info(f"Batched response had no features for {url}, asking for the page alone")
+            results[url] = identify_page_features(url, discovered_pages[url], navigation_map, qa_agent)
+    return results
+
+def _page_batches(urls, payload_of, token_budget, output_of=None):
+    """Pack pages into batches whose prompt payloads fit token_budget (no batching if falsy).
+
+    output_of(url) is the page's expected share of the response; batches
+    are also kept within MAX_BATCH_OUTPUT_TOKENS of it.
+    """
+    if not token_budget:
+        return [[url] for url in urls]
+    return pack_by_token_budget(urls, lambda url: estimate_tokens(payload_of(url)), token_budget,
+                                max_items=MAX_PAGES_PER_BATCH, output_tokens_of=output_of,
+                                output_budget=MAX_BATCH_OUTPUT_TOKENS)
+
+def _feature_payload(discovered_pages, navigation_map):
+    return lambda url: compact_page_features(raw_page_features(url, discovered_pages[url], navigation_map))
+
+def _feature_output(url):
+    return EXPECTED_FEATURE_TOKENS_PER_PAGE
+
+def identify_features(discovered_pages, navigation_map, qa_agent, token_budget=BATCH_TOKEN_BUDGET):
+    """Use AI to identify features from the discovered page structure.
+
+    Small pages are packed into shared requests of up to token_budget prompt
+    tokens; pages bigger than that still get a request of their own.
+    """
+    logger.info("Identifying features from discovered pages")
+    all_features = []
+    
+    # Process each batch of discovered pages
+    for batch in _page_batches(list(discovered_pages), _feature_payload(discovered_pages, navigation_map), token_budget,
+                               _feature_output):
+        batch_features = identify_batch_features(batch, discovered_pages, navigation_map, qa_agent)
+        for url in batch:
+            all_features.extend(batch_features[url])
+    
+    return all_features
+
+def _features_by_page(all_features):
+    """Group features by page, keeping first-seen page order"""
     features_by_page = {}
     for feature in all_features:
         url = feature["page_url"]
         if url not in features_by_page:
             features_by_page[url] = []
         features_by_page[url].append(feature)
+    return features_by_page
+
+def _clusters_by_representative(page_clusters):
+    """Pages that stand in for a whole template cluster"""
+    return {cluster["representative"]: cluster for cluster in (page_clusters or {}).values()}
+
+def _scenario_page_section(url, page_features, navigation_map, cluster=None):
+    """The page-specific part of a scenario prompt"""
+    chunk_nav = navigation_map.neighborhood(url)
+    outgoing_links = [f'"{info["via"].strip()}" -> {target}' for target, info in chunk_nav.items() if target != url]
+    navigation_step = navigation_map.navigation_step(url) or f'Given I am on "{url}"'
+
+    template_note = ""
+    if cluster and len(cluster["urls"]) > 1:
+        other_urls = [other for other in cluster["urls"] if other != url]
+        template_note = f"""
+    TEMPLATE: This page shares its layout with {len(other_urls)} other pages (e.g. {", ".join(other_urls[:3])}).
+    Write scenarios that apply to every page built from this template, using a Scenario Outline where useful.
+    """
     
-    # Process in smaller chunks to avoid token limits but generate more scenarios
-    all_scenarios = []
-    page_urls = list(features_by_page.keys())
+    return f"""
+    PAGE URL: {url}
+    PAGE TITLE: {page_features[0]["page_title"]}
+    {template_note}
+    NAVIGATION (use this step to reach the page in navigation scenarios):
+    {navigation_step}
+    LINKS ON THIS PAGE: {"; ".join(outgoing_links[:MAX_PROMPT_LINKS]) or "none"}
     
-    # Process 1 page at a time for more detailed scenarios
-    for i in range(0, len(page_urls)):
-        url = page_urls[i]
-        chunk_features = {url: features_by_page[url]}
-        chunk_nav = {}
-        
-        # Add relevant navigation paths for this page
-        for target, path in navigation_map.items():
-            if path["from"] == url or target == url:
-                chunk_nav[target] = path
+    FEATURES:
+    {json.dumps(page_features, indent=2)}
+    """
+
+SCENARIO_REQUIREMENTS = """
+    Requirements:
+    1. Create 3-5 scenarios per feature including edge cases
+    2. For forms, include:
+       - Happy path with valid data
+       - Negative tests with invalid data
+       - Required field validation
+       - Format validation (where applicable)
+       - Boundary values testing
+    3. For navigation, include:
+       - Proper navigation steps
+       - URL verification
+       - Page content verification
+    4. For interactions, include:
+       - Expected state changes
+       - Visual feedback verification
+    5. Use appropriate tags to organize scenarios
+    6. Format: valid Gherkin with Feature, Scenario, Given, When, Then
+    7. Be thorough and comprehensive to ensure maximum test coverage
     
-        # Generate scenarios for this page
-        logger.info(f"Generating scenarios for page {i+1} of {len(page_urls)}: {url}")
-        
-        # Generate a prompt for comprehensive scenario creation
-        prompt = f"""
-        Generate comprehensive Gherkin scenarios for this page of a website:
-        
-        PAGE URL: {url}
-        PAGE TITLE: {features_by_page[url][0]["page_title"]}
-        
-        FEATURES:
-        {json.dumps(features_by_page[url], indent=2)}
-        
-        Requirements:
-        1. Create 3-5 scenarios per feature including edge cases
-        2. For forms, include:
-           - Happy path with valid data
-           - Negative tests with invalid data
-           - Required field validation
-           - Format validation (where applicable)
-           - Boundary values testing
-        3. For navigation, include:
-           - Proper navigation steps
-           - URL verification
-           - Page content verification
-        4. For interactions, include:
-           - Expected state changes
-           - Visual feedback verification
-        5. Use appropriate tags to organize scenarios
-        6. Format: valid Gherkin with Feature, Scenario, Given, When, Then
-        7. Be thorough and comprehensive to ensure maximum test coverage
+    IMPORTANT: Each scenario should include detailed steps with specific test data.
+    """
+
+# Marks where each page's scenarios start in a batched response
+PAGE_MARKER = re.compile(r"^[ \t]*#[ \t]*PAGE:[ \t]*(\S+)[ \t]*$", re.MULTILINE)
+
+def _strip_unbalanced_fence(text):
+    """Drop the half of a code fence left behind when a fenced response is split"""
+    text = text.strip()
+    if text.count("```") % 2:
+        if text.startswith("```"):
+            text = text.split("\n", 1)[1] if "\n" in text else ""
+        elif text.endswith("```"):
+            text = text[:-3]
+    return text.strip()
+
+def generate_page_scenarios(url, page_features, navigation_map, qa_agent, cluster=None):
+    """Generate Gherkin scenarios for one page's features.
+
+    cluster is the page's template cluster when the page represents it.
+    """
+    logger.info(f"Generating scenarios for page: {url}")
+    
+    # Generate a prompt for comprehensive scenario creation
+    prompt = f"""
+    Generate comprehensive Gherkin scenarios for this page of a website:
+    {_scenario_page_section(url, page_features, navigation_map, cluster)}
+    {SCENARIO_REQUIREMENTS}"""
+    
+    try:
+        with llm_stage("scenario_generation"):
+            response = qa_agent.run(prompt)
+        return response.content
+    except Exception as e:
+        logger.error(f"Error generating scenarios for page {url}: {str(e)}")
+        return f"""
+        Feature: Error in scenario generation for {url}
         
-        IMPORTANT: Each scenario should include detailed steps with specific test data.
+        Scenario: Error generating scenarios for page
+          Given I encountered an error
+          When generating scenarios
+          Then manual review is needed
+          
+        # Error: {str(e)}
         """
-        
-        try:
+
+def generate_batch_scenarios(urls, features_by_page, navigation_map, qa_agent, clusters_by_representative=None):
+    """Generate Gherkin scenarios for several pages with a single model call.
+
+    Returns {url: scenarios}. Pages missing from the batched response fall
+    back to generate_page_scenarios, as does the last page of a response cut
+    off at max_tokens, since its scenarios are likely incomplete.
+    """
+    clusters_by_representative = clusters_by_representative or {}
+    if len(urls) == 1:
+        url = urls[0]
+        return {url: generate_page_scenarios(url, features_by_page[url], navigation_map, qa_agent,
+                                             clusters_by_representative.get(url))}
+    
+    logger.info(f"Generating scenarios for {len(urls)} pages in one request")
+    page_sections = "\n".join(
+        _scenario_page_section(url, features_by_page[url], navigation_map, clusters_by_representative.get(url))
+        for url in urls
+    )
+    prompt = f"""
+    Generate comprehensive Gherkin scenarios for each of these {len(urls)} pages of a website.
+    Write a separate Feature for every page, and start each page's output with a line
+    "# PAGE: <page url>" using its exact PAGE URL.
+    {page_sections}
+    {SCENARIO_REQUIREMENTS}"""
+    
+    scenarios = {}
+    try:
+        with llm_stage("scenario_generation"):
             response = qa_agent.run(prompt)
-            all_scenarios.append(response.content)
-        except Exception as e:
-            logger.error(f"Error generating scenarios for page {url}: {str(e)}")
-            all_scenarios.append(f"""
-            Feature: Error in scenario generation for {url}
-            
-            Scenario: Error generating scenarios for page
-              Given I encountered an error
-              When generating scenarios
-              Then manual review is needed
-              
-            # Error: {str(e)}
-            """)
+        parts = PAGE_MARKER.split(response.content)
+        # parts is [preamble, url, scenarios, url, scenarios, ...]
+        for marker_url, page_scenarios in zip(parts[1::2], parts[2::2]):
+            if marker_url in urls and _strip_unbalanced_fence(page_scenarios):
+                scenarios[marker_url] = _strip_unbalanced_fence(page_scenarios)
+        if len(parts) > 1 and _truncated(qa_agent, response):
+            logger.warning(f"Batched scenarios were cut off at the output token limit after {parts[-2]}")
+            scenarios.pop(parts[-2], None)
+    except Exception as e:
+        logger.error(f"Error generating batched scenarios: {str(e)}")
+    
+    for url in urls:
+        if url not in scenarios:
+            logger.info(f"Batched response had no scenarios for {url}, asking for the page alone")
+            scenarios[url] = generate_page_scenarios(url, features_by_page[url], navigation_map, qa_agent,
+                                                     clusters_by_representative.get(url))
+    return scenarios
+
+def _scenario_payload(features_by_page):
+    return lambda url: json.dumps(features_by_page[url], indent=2)
+
+def _scenario_output(features_by_page):
+    return lambda url: EXPECTED_SCENARIO_TOKENS_PER_FEATURE * len(features_by_page[url])
+
+def generate_scenarios_from_features(all_features, navigation_map, qa_agent, page_clusters=None,
+                                     token_budget=BATCH_TOKEN_BUDGET):
+    """Generate Gherkin scenarios from identified features.
+
+    page_clusters ({template: {"representative", "urls"}}, as built by
+    run_discovery_pipeline) lets a representative page's scenarios cover
+    every page built from the same template. Pages with few features share
+    requests of up to token_budget prompt tokens.
+    """
+    logger.info("Generating Gherkin scenarios from features")
+    features_by_page = _features_by_page(all_features)
+    clusters_by_representative = _clusters_by_representative(page_clusters)
+    
+    all_scenarios = []
+    for batch in _page_batches(list(features_by_page), _scenario_payload(features_by_page), token_budget,
+                               _scenario_output(features_by_page)):
+        batch_scenarios = generate_batch_scenarios(batch, features_by_page, navigation_map, qa_agent,
+                                                   clusters_by_representative)
+        all_scenarios.extend(batch_scenarios[url] for url in batch)
     
     # Combine all scenario chunks
     combined_scenarios = "\n\n".join(all_scenarios)
-    return combined_scenarios 
\ No newline at end of file
+    return combined_scenarios
+
+async def run_discovery_pipeline(start_url, qa_agent, analyze_per_template=True, on_progress=None,
+                                 queue_size=PIPELINE_QUEUE_SIZE, llm_concurrency=MAX_CONCURRENT_LLM_CALLS,
+                                 batch_token_budget=BATCH_TOKEN_BUDGET, **crawl_options):
+    """Crawl, identify features and generate scenarios as overlapping stages.
+
+    Each page flows from the crawler to feature identification and on to
+    scenario generation through bounded queues, so the browser and the LLM
+    work at the same time. With analyze_per_template only the first page of
+    each template is sent downstream. on_progress(progress) is called with a
+    dict of per-stage counters whenever any stage moves forward.
+    Up to llm_concurrency requests are with the model at once, and small pages
+    waiting in a queue share a request of up to batch_token_budget prompt
+    tokens; results are still returned in crawl order.
+    crawl_options are passed to discover_website_pages.
+    """
+    discovered_pages = {}
+    navigation_map = SiteGraph()
+    page_clusters = {}
+    crawl_stats = {}
+    features_by_page = {}
+    scenarios_by_page = {}
+    page_order = []
+    progress = {
+        "pages_crawled": 0,
+        "pages_pending": 0,
+        "crawl_done": False,
+        "budget_exhausted": None,
+        "pages_to_analyze": 0,
+        "pages_analyzed": 0,
+        "pages_completed": 0
+    }
+    llm_slots = asyncio.Semaphore(llm_concurrency)
+    feature_queue = asyncio.Queue(maxsize=queue_size)
+    scenario_queue = asyncio.Queue(maxsize=queue_size)
+    
+    def report():
+        progress["pages_crawled"] = crawl_stats.get("pages_crawled", 0)
+        progress["pages_pending"] = crawl_stats.get("pages_pending", 0)
+        progress["budget_exhausted"] = crawl_stats.get("budget_exhausted")
+        if on_progress:
+            on_progress(dict(progress))
+    
+    def page_navigation(*urls):
+        # Snapshot taken on the event loop, since crawling keeps adding edges
+        return navigation_map.subgraph(*urls)
+    
+    async def crawl_stage():
+        try:
+            async for url, page_data in discover_website_pages(start_url, discovered_pages, navigation_map,
+                                                               crawl_stats=crawl_stats, **crawl_options):
+                cluster = page_clusters.setdefault(page_template(page_data), {"representative": url, "urls": []})
+                cluster["urls"].append(url)
+                if analyze_per_template and cluster["representative"] != url:
+                    report()
+                    continue
+                progress["pages_to_analyze"] += 1
+                page_order.append(url)
+                report()
+                await feature_queue.put(url)
+        finally:
+            progress["crawl_done"] = True
+            await feature_queue.put(None)
+            report()
+    
+    async def identify(batch):
+        try:
+            batch_features = await asyncio.to_thread(
+                identify_batch_features, batch, {url: discovered_pages[url] for url in batch},
+                page_navigation(*batch), qa_agent
+            )
+        except Exception as e:
+            logger.error(f"Feature identification failed for {', '.join(batch)}: {str(e)}")
+            batch_features = {}
+        finally:
+            llm_slots.release()
+        for url in batch:
+            features_by_page[url] = batch_features.get(url, [])
+            progress["pages_analyzed"] += 1
+            if not features_by_page[url]:
+                # Nothing to write scenarios for
+                progress["pages_completed"] += 1
+        report()
+        for url in batch:
+            if features_by_page[url]:
+                await scenario_queue.put(url)
+    
+    async def write_scenarios(batch):
+        try:
+            clusters = {}
+            if analyze_per_template:
+                for url in batch:
+                    cluster = page_clusters.get(page_template(discovered_pages[url]))
+                    # Copied because the crawl keeps adding URLs to the cluster
+                    clusters[url] = dict(cluster, urls=list(cluster["urls"])) if cluster else None
+            scenarios_by_page.update(await asyncio.to_thread(
+                generate_batch_scenarios, batch, features_by_page, page_navigation(*batch), qa_agent, clusters
+            ))
+        finally:
+            llm_slots.release()
+        progress["pages_completed"] += len(batch)
+        report()
+    
+    def feature_payload(url):
+        return compact_page_features(raw_page_features(url, discovered_pages[url], navigation_map))
+    
+    def scenario_payload(url):
+        return json.dumps(features_by_page[url], indent=2)
+    
+    def scenario_output(url):
+        return EXPECTED_SCENARIO_TOKENS_PER_FEATURE * len(features_by_page[url])
+    
+    async def fan_out(source_queue, payload_of, output_of, batch_work):
+        # Pages already waiting in the queue are packed into token-budgeted
+        # batches. A slot is taken before each batch starts, so at most
+        # llm_concurrency requests are with the model across both LLM stages
+        tasks = []
+        finished = False
+        while not finished:
+            urls = [await source_queue.get()]
+            while not source_queue.empty():
+                urls.append(source_queue.get_nowait())
+            if None in urls:
+                finished = True
+                urls = urls[:urls.index(None)]
+            for batch in _page_batches(urls, payload_of, batch_token_budget, output_of):
+                await llm_slots.acquire()
+                tasks.append(asyncio.create_task(batch_work(batch)))
+        await asyncio.gather(*tasks)
+    
+    async def feature_stage():
+        try:
+            await fan_out(feature_queue, feature_payload, _feature_output, identify)
+        finally:
+            await scenario_queue.put(None)
+    
+    async def scenario_stage():
+        await fan_out(scenario_queue, scenario_payload, scenario_output, write_scenarios)
+    
+    await asyncio.gather(crawl_stage(), feature_stage(), scenario_stage())
+    
+    all_features = [feature for url in page_order for feature in features_by_page.get(url, [])]
+    generated_steps = "\n\n".join(scenarios_by_page[url] for url in page_order if url in scenarios_by_page)
+    return {
+        "discovered_pages": discovered_pages,
+        "navigation_map": navigation_map,
+        "page_clusters": page_clusters,
+        "all_features": all_features,
+        "generated_steps": generated_steps,
+        "crawl_stats": crawl_stats
+    }